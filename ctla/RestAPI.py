@@ -1,9 +1,17 @@
 import logging
+import threading
+import time
 from collections.abc import Mapping
 from typing import Any, Optional
 
 import requests
 
+import cassette
+import config
+import logs
+from breaker import CircuitBreaker
+from response_cache import ResponseCache
+
 log = logging.getLogger(__name__)
 
 
@@ -16,6 +24,63 @@ class RestAPI:
     """Headers to send with every request"""
     _auth: Optional[tuple[str, str]] = None
     """Authentication details (username password)"""
+    breaker: Optional[CircuitBreaker] = None
+    """Circuit breaker guarding all requests to this API"""
+    response_cache: Optional[ResponseCache] = None
+    """Cache of GET responses, if enabled"""
+    cache_lookups: int = 0
+    """Number of GET requests to paths cached in the :py:attr:`response_cache`"""
+    cache_hits: int = 0
+    """Number of GET requests answered from the :py:attr:`response_cache` without sending them"""
+    requests_sent: int = 0
+    """Number of requests sent"""
+    bytes_received: int = 0
+    """Size of all response bodies received (as transferred, i.e. before decompression)"""
+    request_seconds: float = 0.0
+    """Time spent waiting for responses"""
+    _received_lock = threading.Lock()
+
+    def _record_received(self, response: requests.Response) -> requests.Response:
+        """Count the request and add the size of its consumed response body to :py:attr:`bytes_received`"""
+        with self._received_lock:
+            self.requests_sent += 1
+            self.bytes_received += response.raw.tell() if response.raw else len(response.content)
+        return response
+
+    @property
+    def _timeout(self) -> tuple[float, float]:
+        """Connect and read timeouts for requests, from ``timeouts``"""
+        return config.timeouts['connect'], config.timeouts['read']
+
+    def _send(self, method: str, url: str, headers: Optional[Mapping[str, str]] = None,
+              **kwargs) -> requests.Response:
+        """
+        Send a request with the common headers, authentication and timeouts, through the :py:attr:`breaker`
+
+        :param headers: Additional headers
+        :raise CircuitOpenError: if the breaker refuses the request
+        """
+        if self.breaker:
+            self.breaker.before_request()
+        headers = {**(self._headers or {}), **(headers or {})}
+        recorder = cassette.active()
+        start = time.perf_counter()
+        try:
+            if recorder:
+                response = cassette.send_requests(recorder, method, url, self._timeout, headers=headers,
+                                                  auth=self._auth, **kwargs)
+            else:
+                response = requests.request(method, url, headers=headers, auth=self._auth, timeout=self._timeout,
+                                            **kwargs)
+        except requests.RequestException:
+            if self.breaker:
+                self.breaker.record(None)
+            raise
+        with self._received_lock:
+            self.request_seconds += time.perf_counter() - start
+        if self.breaker:
+            self.breaker.record(response.status_code)
+        return response
 
     def _do_get(self, path: str, **kwargs) -> requests.Response:
         """
@@ -26,20 +91,57 @@ class RestAPI:
         :return: The ``requests``-library's Response-object.
         """
         url = self.urlbase + path
-        log.debug(f'Perform GET request to {url} (parameters: {kwargs})')
-        return requests.get(url, params=kwargs, headers=self._headers, auth=self._auth)
+        ttl = self.response_cache.ttl_for(path) if self.response_cache else 0
+        if not ttl:
+            log.debug('Perform GET request to %s (parameters: %s)', url, kwargs, extra=logs.SAMPLED)
+            return self._record_received(self._send('GET', url, params=kwargs))
+
+        key = self.response_cache.key(path, kwargs)
+        cached = self.response_cache.get(key)
+        with self._received_lock:
+            self.cache_lookups += 1
+        if cached and cached.fresh:
+            log.debug('Using cached response for GET request to %s (parameters: %s)', url, kwargs, extra=logs.SAMPLED)
+            with self._received_lock:
+                self.cache_hits += 1
+            return cached.to_response(url)
 
-    def _do_post(self, path: str, json: dict[str, Any]):
+        log.debug('Perform %sGET request to %s (parameters: %s)', 'conditional ' if cached else '', url, kwargs,
+                  extra=logs.SAMPLED)
+        r = self._record_received(self._send('GET', url, headers=cached.validators if cached else None, params=kwargs))
+        if r.status_code == 304 and cached:
+            self.response_cache.revalidated(key, r, ttl)
+            return cached.to_response(url)
+        if r.status_code == 200:
+            self.response_cache.store(key, path, r, ttl)
+        return r
+
+    def _invalidate(self, *patterns: str):
+        """
+        Drop cached responses for the given API paths after changing them.
+
+        Paths written to with POST, PATCH or DELETE are invalidated automatically.
+
+        :param patterns: API paths (may contain ``*`` wildcards)
+        """
+        if self.response_cache:
+            for pattern in patterns:
+                self.response_cache.invalidate(pattern)
+
+    def _do_post(self, path: str, json: dict[str, Any], **kwargs):
         """
         Perform POST request
 
         :param path: The API endpoint
         :param json: JSON encodable request body
+        :param kwargs: Query parameters
         :return: The ``requests``-library's Response-object.
         """
         url = self.urlbase + path
-        log.debug(f'Perform POST request to {url} (data: {json})')
-        return requests.post(url, json=json, headers=self._headers, auth=self._auth)
+        log.debug('Perform POST request to %s (data: %s, parameters: %s)', url, json, kwargs)
+        r = self._record_received(self._send('POST', url, json=json, params=kwargs))
+        self._invalidate(path)
+        return r
 
     def _do_patch(self, path: str, json: dict[str, Any]):
         """
@@ -50,8 +152,10 @@ class RestAPI:
         :return: The ``request``-library's Response object
         """
         url = self.urlbase + path
-        log.debug(f'Perform PATCH request to {url} (data: {json})')
-        return requests.patch(url, json=json, headers=self._headers, auth=self._auth)
+        log.debug('Perform PATCH request to %s (data: %s)', url, json)
+        r = self._record_received(self._send('PATCH', url, json=json))
+        self._invalidate(path)
+        return r
 
     def _do_delete(self, path: str):
         """
@@ -61,5 +165,7 @@ class RestAPI:
         :return: The ``requests``-library's Response-object.
         """
         url = self.urlbase + path
-        log.debug(f'Perform DELETE request to {url}')
-        return requests.delete(url, headers=self._headers, auth=self._auth)
+        log.debug('Perform DELETE request to %s', url)
+        r = self._record_received(self._send('DELETE', url))
+        self._invalidate(path)
+        return r
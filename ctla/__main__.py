@@ -1,113 +1,60 @@
-import atexit
+import functools
 import logging
-import pprint
-import time
-
-import requests
 
+import cassette
 import config
-import delete
-import setup
-import update
+import history
+import logs
+import monitor
+import profiling
+import tenants
 from configs import args
-from ct.ChurchTools import ChurchTools
-from data import RuntimeStats
-from wp.WordPress import WordPress
 from yt.YouTube import YouTube
 
-start_time = time.time()
-stats = RuntimeStats()
-
-
-def elapsed_ms() -> int:
-    """
-    Program runtime, in ms
-
-    Used for reporting to uptime monitor
-    """
-    return int((time.time() - start_time) * 1000)
-
-
-logging.basicConfig(level=logging.INFO)
+logs.setup()
 log = logging.getLogger(__name__)
 
 args.parse()
-config.load()
-
-clean_exit = False
-"""Check if a failure occurred"""
-
-
-@atexit.register
-def notify_exit():
-    """Notify external monitor in case of unclean exit"""
-    if not clean_exit and config.monitor_url:
-        msg = ''
-        if 'event' in globals() and event is not None:
-            msg = f' during handling of event "{event.title}" ({event.id})'
-        if 'wp' in globals() and wp is not None:
-            msg = f' during update of WordPress'
-        requests.get(config.monitor_url.format(status='down', msg=f'Something went wrong{msg}.', ping=elapsed_ms()))
-
-
-ct = ChurchTools()
-yt = YouTube()
+logs.setup(args.parsed.log_level, args.parsed.log_json, args.parsed.log_sample)
+main_config = config.load()
 
 if args.parsed.show_stream_keys:
+    yt = YouTube()
     print("These YouTube-Stream keys are available:\n" + yt.format_stream_keys())
-    clean_exit = True
     exit(1)
 
-events = list(setup.gather_event_info(ct, yt, stats))
-stats.total = len(events)
-
-log.debug(pprint.pformat(events))
-
-for event in events:
-    if event.wants_stream:
-        change = False
-
-        if not event.yt_broadcast:
-            if event.yt_link:
-                # Link is present, but Stream isn't: Delete the old link
-                ct.delete_link(event.yt_link.id)
-
-            update.create_youtube(ct, yt, event)
-            stats.new += 1
-
-        change |= update.update_youtube(yt, event)
-
-        if event.facts.create_post:
-            if not event.post_link:
-                update.create_post(ct, event)
-                change |= True
-            else:
-                change |= update.update_post(ct, event)
-        else:
-            change |= delete.delete_post(ct, event)
-
-        if change:
-            stats.updated += 1
-
-    else:
-        if not event.yt_broadcast or event.yt_broadcast['status']['lifeCycleStatus'] in {'created', 'ready'}:
-            # Only delete Broadcast if it hasn't happened yet
-            delete.delete_stream(ct, yt, event)
-            stats.deleted += 1
-        delete.delete_post(ct, event)
-
-# WordPress
-if config.wordpress['enabled']:
-    wp = WordPress()
-    update.update_wordpress(wp, [ev for ev in events if ev.yt_link and ev.facts.on_homepage])
-
-if config.monitor_url:
-    requests.get(config.monitor_url.format(
-        status='up',
-        msg='OK: '
-            f'change:{stats.updated} (new:{stats.new}),del:{stats.deleted} | '
-            f'total:{stats.total} (skip:{stats.skipped})',
-        ping=elapsed_ms()
-    ))
-
-clean_exit = True
+if args.parsed.tenant:
+    tenant_list = [tenants.Tenant(config.load_tenant(tenant_file)) for tenant_file in args.parsed.tenant]
+else:
+    tenant_list = [tenants.Tenant(main_config)]
+
+if args.parsed.history:
+    for tenant in tenant_list:
+        config.activate(tenant.config)
+        print(f'Run history of tenant "{tenant.name}":\n{history.summarize(history.load())}\n')
+    exit(0)
+
+if args.parsed.record:
+    cassette.start(args.parsed.record, 'record')
+elif args.parsed.replay:
+    cassette.start(args.parsed.replay, 'replay', args.parsed.replay_latency)
+
+if args.parsed.profile or args.parsed.profile_mem:
+    profiling.start(args.parsed.profile_dir, cpu=args.parsed.profile, memory=args.parsed.profile_mem)
+
+if args.parsed.gc:
+    success = tenants.run_all(tenant_list, args.parsed.workers,
+                              functools.partial(tenants.Tenant.collect_garbage, dry_run=args.parsed.dry_run))
+else:
+    interval = args.parsed.interval * 60 if args.parsed.interval else None
+    success = tenants.serve(tenant_list, args.parsed.workers, interval)
+
+    # Reports are sent in the background: wait for the last ones, but not longer than sending them may take
+    if not monitor.flush():
+        log.warning('Could not send all reports to the monitor in time.')
+
+profiling.stop()
+if not cassette.stop():
+    success = False
+if not success:
+    exit(1)
@@ -0,0 +1,113 @@
+"""
+Circuit breakers for the upstream APIs
+"""
+import logging
+import socket
+import threading
+import time
+from enum import Enum
+from typing import Optional
+
+import google.auth.exceptions
+import googleapiclient.errors
+import httplib2
+import requests
+
+import config
+
+log = logging.getLogger(__name__)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of sending a request to an upstream whose circuit breaker is open"""
+
+
+UPSTREAM_ERRORS = (
+    CircuitOpenError,
+    requests.RequestException,
+    googleapiclient.errors.HttpError,
+    google.auth.exceptions.GoogleAuthError,
+    httplib2.HttpLib2Error,
+    # Raised as is by httplib2. Other OSErrors are local failures (files, disk), which must not degrade the run
+    ConnectionError,
+    TimeoutError,
+    socket.gaierror
+)
+"""Errors caused by an upstream being unavailable or refusing a request"""
+
+
+class State(Enum):
+    CLOSED = 'closed'
+    """Requests are sent"""
+    OPEN = 'open'
+    """Requests are refused"""
+    HALF_OPEN = 'half-open'
+    """A single probe request is sent to check whether the upstream has recovered"""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for one upstream.
+
+    Trips after ``circuit_breaker.failure_threshold`` consecutive failures and refuses requests for
+    ``circuit_breaker.reset_seconds``. Then a single probe request decides whether it closes or stays open.
+    """
+
+    name: str
+    """Name of the upstream, for log messages"""
+    state: State = State.CLOSED
+    failures: int = 0
+    """Consecutive failures"""
+    _opened_at: float = 0.0
+    _threshold: int
+    _reset_seconds: float
+    _lock: threading.Lock
+
+    def __init__(self, name: str):
+        self.name = name
+        self._threshold = config.circuit_breaker['failure_threshold']
+        self._reset_seconds = config.circuit_breaker['reset_seconds']
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        """
+        Check whether a request may be sent
+
+        :raise CircuitOpenError: if the breaker is open, or another request is already probing the upstream
+        """
+        with self._lock:
+            if self.state == State.CLOSED:
+                return
+            if self.state == State.OPEN and time.monotonic() - self._opened_at >= self._reset_seconds:
+                log.info('Probing %s after %s failure(s)…', self.name, self.failures)
+                self.state = State.HALF_OPEN
+                return
+        raise CircuitOpenError(f'{self.name} is unavailable (circuit breaker {self.state.value})')
+
+    def record(self, status: Optional[int]):
+        """
+        Record the outcome of a request
+
+        :param status: HTTP status of the response, or ``None`` if no response was received
+        """
+        if status is None or status >= 500 or status == 429:
+            self._record_failure()
+        else:
+            self._record_success()
+
+    def _record_success(self):
+        with self._lock:
+            if self.state != State.CLOSED:
+                log.info('%s has recovered, closing circuit breaker.', self.name)
+            self.state = State.CLOSED
+            self.failures = 0
+
+    def _record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == State.HALF_OPEN or self.failures >= self._threshold:
+                if self.state != State.OPEN:
+                    log.warning('%s failed %s time(s), refusing requests for %.0fs.', self.name, self.failures,
+                                self._reset_seconds)
+                self.state = State.OPEN
+                self._opened_at = time.monotonic()
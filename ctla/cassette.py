@@ -0,0 +1,331 @@
+"""
+Recording and replaying of the HTTP exchanges with ChurchTools, YouTube and WordPress (``--record`` / ``--replay``)
+
+A cassette is a JSON lines file with one exchange per line. Credentials are scrubbed before they are written.
+When replaying, requests are answered from the cassette without using the network, optionally with the recorded
+latencies. Writes (POST, PUT, PATCH, DELETE) that were not recorded, and recorded writes that were not sent again,
+are reported as mismatches, so a replay shows whether a change still sends the same writes.
+"""
+import base64
+import hashlib
+import http
+import http.client
+import io
+import json
+import logging
+import threading
+import time
+import urllib.parse
+import urllib.request
+import urllib.response
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Literal, Optional
+
+import httplib2
+import requests
+from requests.structures import CaseInsensitiveDict
+
+log = logging.getLogger(__name__)
+
+type Mode = Literal['record', 'replay']
+type Response = tuple[int, dict[str, str], bytes]
+"""Status, headers and body of a response"""
+
+SCRUBBED = '<scrubbed>'
+SENSITIVE_KEYS = frozenset({
+    'access_token', 'refresh_token', 'id_token', 'client_secret', 'token', 'login_token', 'password', 'app_password',
+    'key'
+})
+"""Query parameters and JSON or form fields whose values are never recorded"""
+SENSITIVE_HEADERS = frozenset({'authorization', 'cookie', 'set-cookie', 'www-authenticate'})
+_DROPPED_HEADERS = frozenset({'content-encoding', 'content-length', 'transfer-encoding', 'status'})
+"""Response headers that do not apply to the recorded (decoded) body"""
+WRITE_METHODS = frozenset({'POST', 'PUT', 'PATCH', 'DELETE'})
+DATE_PARAMS = frozenset({'from', 'to'})
+"""Query parameters holding the current date, which may differ between recording and replay"""
+
+
+class CassetteMismatchError(RuntimeError):
+    """Raised when replaying a request that is not in the cassette"""
+
+
+@dataclass(slots=True)
+class Exchange:
+    """A recorded request and its response"""
+    method: str
+    url: str
+    body: Optional[str]
+    """The scrubbed request body, or the SHA-256 digest of binary bodies"""
+    status: int
+    headers: dict[str, str]
+    content: bytes
+    latency: float
+    """Seconds from sending the request until the response was received"""
+
+    @property
+    def key(self) -> tuple[str, str, Optional[str]]:
+        return self.method, self.url, self.body
+
+    def to_json(self) -> dict[str, Any]:
+        try:
+            content, encoding = self.content.decode('utf-8'), 'utf-8'
+        except UnicodeDecodeError:
+            content, encoding = base64.b64encode(self.content).decode('ascii'), 'base64'
+        return {'method': self.method, 'url': self.url, 'body': self.body, 'status': self.status,
+                'headers': self.headers, 'content': content, 'encoding': encoding, 'latency': round(self.latency, 4)}
+
+    @classmethod
+    def from_json(cls, data: dict[str, Any]) -> 'Exchange':
+        content = data['content']
+        return cls(data['method'], data['url'], data['body'], data['status'], data['headers'],
+                   base64.b64decode(content) if data['encoding'] == 'base64' else content.encode('utf-8'),
+                   data['latency'])
+
+
+class Cassette:
+    """A cassette being recorded or replayed. Can be used by multiple threads at once"""
+
+    path: Path
+    mode: Mode
+    with_latency: bool
+    """Whether replayed responses are delayed by their recorded latency"""
+    mismatches: list[str]
+    """Descriptions of the requests that differed from the recording"""
+    _recorded: dict[tuple[str, str, Optional[str]], deque[Exchange]]
+    """Exchanges not replayed yet, by request"""
+    _lock: threading.Lock
+
+    def __init__(self, path: Path, mode: Mode, with_latency: bool = False):
+        self.path = path
+        self.mode = mode
+        self.with_latency = with_latency
+        self.mismatches = []
+        self._recorded = {}
+        self._lock = threading.Lock()
+
+        if mode == 'record':
+            path.write_text('')
+            log.info('Recording HTTP exchanges to %s', path)
+        else:
+            for line in path.read_text().splitlines():
+                exchange = Exchange.from_json(json.loads(line))
+                self._recorded.setdefault(exchange.key, deque()).append(exchange)
+            log.info('Replaying %s HTTP exchange(s) from %s', sum(map(len, self._recorded.values())), path)
+
+    def exchange(self, method: str, url: str, body: Optional[bytes | str], send: Callable[[], Response]) -> Response:
+        """
+        Record the request sent with ``send``, or answer it from the cassette
+
+        :param method: The request method
+        :param url: The full URL, including the query
+        :param body: The request body
+        :param send: Sends the request and returns the response
+        :return: The response
+        :raise CassetteMismatchError: if the request was not recorded
+        """
+        method = method.upper()
+        key = (method, _scrub_url(url), _scrub_body(body))
+        if self.mode == 'record':
+            start = time.perf_counter()
+            status, headers, content = send()
+            exchange = Exchange(*key, status, _scrub_headers(headers), content, time.perf_counter() - start)
+            with self._lock, self.path.open('a') as f:
+                f.write(json.dumps(exchange.to_json()) + '\n')
+            return status, headers, content
+
+        exchange = self._take(key)
+        if exchange is None:
+            mismatch = f'{method} {key[1]} was not recorded' + (f' (body: {key[2]})' if key[2] else '')
+            with self._lock:
+                self.mismatches.append(mismatch)
+            raise CassetteMismatchError(mismatch)
+        if self.with_latency:
+            time.sleep(exchange.latency)
+        return exchange.status, exchange.headers, exchange.content
+
+    def _take(self, key: tuple[str, str, Optional[str]]) -> Optional[Exchange]:
+        """
+        Remove and return the next recorded exchange for the request.
+
+        Reads whose query only differs in the :py:data:`DATE_PARAMS` (e.g. as the replay runs on another day)
+        fall back to the next recorded read that matches in everything else.
+        """
+        method, url, _ = key
+        with self._lock:
+            recorded = self._recorded.get(key)
+            if not recorded and method not in WRITE_METHODS:
+                undated = _without_dates(url)
+                recorded = next((exchanges for (m, u, _), exchanges in self._recorded.items()
+                                 if exchanges and m == method and _without_dates(u) == undated), None)
+            return recorded.popleft() if recorded else None
+
+    def close(self) -> bool:
+        """
+        Finish recording or replaying and log the mismatches
+
+        :return: True if the replay sent the same writes as the recording
+        """
+        if self.mode == 'record':
+            log.info('Recorded HTTP exchanges to %s', self.path)
+            return True
+
+        with self._lock:
+            self.mismatches += [f'{exchange.method} {exchange.url} was recorded, but not sent'
+                                for exchanges in self._recorded.values() for exchange in exchanges
+                                if exchange.method in WRITE_METHODS]
+        for mismatch in self.mismatches:
+            log.error('Replay mismatch: %s', mismatch)
+        log.info('Replay of %s finished with %s mismatch(es).', self.path, len(self.mismatches))
+        return not self.mismatches
+
+
+_active: Optional[Cassette] = None
+
+
+def active() -> Optional[Cassette]:
+    """The cassette being recorded or replayed, if any"""
+    return _active
+
+
+def replaying() -> bool:
+    """Whether requests are answered from a cassette instead of the network"""
+    return _active is not None and _active.mode == 'replay'
+
+
+def start(path: Path, mode: Mode, with_latency: bool = False):
+    """Start recording or replaying the cassette for all requests of this process"""
+    global _active
+    _active = Cassette(path, mode, with_latency)
+
+
+def stop() -> bool:
+    """
+    Stop recording or replaying
+
+    :return: False if the replay did not send the same writes as the recording
+    """
+    global _active
+    cassette, _active = _active, None
+    return cassette.close() if cassette else True
+
+
+def send_requests(cassette: Cassette, method: str, url: str, timeout: Any, **kwargs) -> requests.Response:
+    """
+    Send a request with ``requests`` through the cassette
+
+    :param cassette: The active cassette
+    :param timeout: The timeout passed on to ``requests``
+    :param kwargs: Passed on to ``requests.Request`` (e.g. ``headers``, ``auth``, ``params``, ``json``)
+    """
+    prepared = requests.Request(method, url, **kwargs).prepare()
+
+    def send() -> Response:
+        with requests.Session() as session:
+            r = session.send(prepared, timeout=timeout)
+        return r.status_code, dict(r.headers), r.content
+
+    status, headers, content = cassette.exchange(prepared.method, prepared.url, prepared.body, send)
+    response = requests.Response()
+    response.status_code = status
+    response.reason = _reason(status)
+    response.url = prepared.url
+    response.request = prepared
+    response.headers = CaseInsensitiveDict(headers)
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    response._content = content
+    response._content_consumed = True
+    return response
+
+
+def send_httplib2(cassette: Cassette, send: Callable[..., tuple[httplib2.Response, bytes]], uri: str,
+                  method: str = 'GET', body: Optional[bytes | str] = None, **kwargs) -> tuple[httplib2.Response, bytes]:
+    """
+    Send a request with an ``httplib2.Http`` through the cassette
+
+    :param cassette: The active cassette
+    :param send: The ``request`` method of the client
+    """
+    def send_request() -> Response:
+        response, content = send(uri, method, body, **kwargs)
+        return response.status, dict(response), content or b''
+
+    status, headers, content = cassette.exchange(method, uri, body, send_request)
+    return httplib2.Response({**headers, 'status': str(status)}), content
+
+
+def urlopen(url: str, timeout: float) -> http.client.HTTPResponse | urllib.response.addinfourl:
+    """``urllib.request.urlopen`` through the active cassette, if any"""
+    cassette = _active
+    if cassette is None:
+        return urllib.request.urlopen(url, timeout=timeout)
+
+    def send() -> Response:
+        with urllib.request.urlopen(url, timeout=timeout) as r:
+            return r.status, dict(r.headers), r.read()
+
+    status, headers, content = cassette.exchange('GET', url, None, send)
+    message = http.client.HTTPMessage()
+    for name, value in headers.items():
+        message[name] = value
+    return urllib.response.addinfourl(io.BytesIO(content), message, url, status)
+
+
+def _reason(status: int) -> str:
+    try:
+        return http.HTTPStatus(status).phrase
+    except ValueError:
+        return ''
+
+
+def _without_dates(url: str) -> str:
+    """The URL without the :py:data:`DATE_PARAMS`, with the other query parameters in a canonical order"""
+    parts = urllib.parse.urlsplit(url)
+    query = sorted((name, value) for name, value in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+                   if name not in DATE_PARAMS)
+    return urllib.parse.urlunsplit(parts._replace(query=urllib.parse.urlencode(query)))
+
+
+def _scrub_url(url: str) -> str:
+    """Replace sensitive query parameters"""
+    parts = urllib.parse.urlsplit(url)
+    if not parts.query:
+        return url
+    query = [(name, SCRUBBED if name in SENSITIVE_KEYS else value)
+             for name, value in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)]
+    return urllib.parse.urlunsplit(parts._replace(query=urllib.parse.urlencode(query)))
+
+
+def _scrub_body(body: Optional[bytes | str]) -> Optional[str]:
+    """Normalize the request body and replace sensitive fields. Binary bodies are replaced by their digest"""
+    if not body:
+        return None
+    if isinstance(body, bytes):
+        try:
+            body = body.decode('utf-8')
+        except UnicodeDecodeError:
+            return 'sha256:' + hashlib.sha256(body).hexdigest()
+    try:
+        return json.dumps(_scrub_json(json.loads(body)), sort_keys=True)
+    except ValueError:
+        pass
+    form = urllib.parse.parse_qsl(body, keep_blank_values=True)
+    if form and '=' in body:
+        return urllib.parse.urlencode([(name, SCRUBBED if name in SENSITIVE_KEYS else value) for name, value in form])
+    return body
+
+
+def _scrub_json(data: Any) -> Any:
+    if isinstance(data, dict):
+        return {key: SCRUBBED if key in SENSITIVE_KEYS else _scrub_json(value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [_scrub_json(value) for value in data]
+    return data
+
+
+def _scrub_headers(headers: dict[str, str]) -> dict[str, str]:
+    """Drop sensitive response headers and those describing the transfer encoding"""
+    return {name: value for name, value in headers.items()
+            if name.lower() not in SENSITIVE_HEADERS and name.lower() not in _DROPPED_HEADERS}
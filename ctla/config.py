@@ -1,11 +1,24 @@
+import copy
 import json
 import logging
 import os.path
-from typing import TypedDict, Optional
+import tempfile
+from contextvars import ContextVar, Token
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TypedDict, Optional, TextIO
 
 import utils
 from configs import args
 from configs.churchtools import ChurchToolsConf
+from configs.circuit_breaker import CircuitBreakerConf
+from configs.compiled import CompiledConfig, compile_config
+from configs.gc import GcConf
+from configs.history import HistoryConf
+from configs.journal import JournalConf
+from configs.locking import LockingConf
+from configs.monitor import MonitorConf
+from configs.timeouts import TimeoutConf
 from configs.wordpress import WordPressConf
 from configs.youtube import YouTubeConf
 
@@ -19,6 +32,9 @@ class Config(TypedDict):
     churchtools: ChurchToolsConf
     youtube: YouTubeConf
     wordpress: None
+    locking: LockingConf
+    gc: GcConf
+    journal: JournalConf
     monitor_url: Optional[str]
     """
     Optional monitor URL for external monitoring.
@@ -27,13 +43,99 @@ class Config(TypedDict):
     - {ping}: Elapsed runtime in ms
     - {msg}: 'OK' or 'Something went wrong'
     """
+    monitor: MonitorConf
+    history: HistoryConf
+    timeouts: TimeoutConf
+    circuit_breaker: CircuitBreakerConf
+    name: Optional[str]
+    """Name of the tenant (only used in tenant configuration files)"""
+
+
+@dataclass(frozen=True, slots=True)
+class TenantConfig:
+    """A fully loaded configuration, which can be made available with :py:func:`activate`"""
+    name: Optional[str]
+    """Name of the tenant, or ``None`` for the main configuration"""
+    churchtools: ChurchToolsConf
+    youtube: YouTubeConf
+    wordpress: WordPressConf
+    locking: LockingConf
+    gc: GcConf
+    journal: JournalConf
+    monitor_url: Optional[str]
+    monitor: MonitorConf
+    history: HistoryConf
+    timeouts: TimeoutConf
+    circuit_breaker: CircuitBreakerConf
+    compiled: CompiledConfig
 
 
-# Easy access to loaded config
+# Easy access to the active config (resolved by `__getattr__`)
 churchtools: ChurchToolsConf
 youtube: YouTubeConf
 wordpress: WordPressConf
+locking: LockingConf
+gc: GcConf
+journal: JournalConf
 monitor_url: Optional[str]
+monitor: MonitorConf
+history: HistoryConf
+timeouts: TimeoutConf
+circuit_breaker: CircuitBreakerConf
+compiled: CompiledConfig
+"""Validated and precompiled configuration for lookups on hot paths"""
+
+_active: ContextVar[TenantConfig] = ContextVar('active_config')
+"""Configuration activated in the current context"""
+_loaded: Optional[TenantConfig] = None
+"""Main configuration, used wherever no other configuration was activated"""
+_merged: Optional[Config] = None
+"""The merged main configuration, used as base for tenant configurations"""
+
+
+def __getattr__(name: str):
+    """Resolve the configuration sections from the configuration active in the current context"""
+    if name in TenantConfig.__dataclass_fields__ and name != 'name':
+        return getattr(active(), name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def active() -> TenantConfig:
+    """
+    Return the configuration active in the current context
+
+    :raise RuntimeError: if no configuration has been loaded
+    """
+    tenant = _active.get(_loaded)
+    if tenant is None:
+        raise RuntimeError('No configuration has been loaded')
+    return tenant
+
+
+def activate(tenant: TenantConfig) -> Token:
+    """
+    Make the given configuration available in the current context (thread or task)
+
+    :param tenant: The configuration to activate
+    :return: A token to restore the previous configuration with ``_active.reset``
+    """
+    return _active.set(tenant)
+
+
+def temp_path(filename: str) -> Path:
+    """
+    Resolve a file name relative to ``tempfile.gettempdir()``.
+
+    When a tenant is active, relative file names are prefixed with the tenant's name to keep their state separate.
+
+    :param filename: The configured file name, may be absolute
+    :return: The path
+    """
+    path = Path(filename)
+    name = active().name
+    if name and not path.is_absolute():
+        path = path.with_name(f'{name}-{path.name}')
+    return Path(tempfile.gettempdir()).joinpath(path)
 
 
 def filter_none[T: dict](target: T) -> T:
@@ -119,8 +221,27 @@ def _load_cli_params() -> Config:
     return {}  # currently nothing is configurable via cli
 
 
+def _build_tenant(config: Config, name: Optional[str] = None) -> TenantConfig:
+    """Validate and compile a merged configuration"""
+    return TenantConfig(
+        name=name,
+        churchtools=config['churchtools'],
+        youtube=config['youtube'],
+        wordpress=config['wordpress'],
+        locking=config['locking'],
+        gc=config['gc'],
+        journal=config['journal'],
+        monitor_url=config.get('monitor_url', None),
+        monitor=config['monitor'],
+        history=config['history'],
+        timeouts=config['timeouts'],
+        circuit_breaker=config['circuit_breaker'],
+        compiled=compile_config(config['churchtools'], config['youtube'], config['wordpress'])
+    )
+
+
 # noinspection PyTypeChecker
-def load():
+def load() -> TenantConfig:
     """
     Load the configuration in the following order (later takes precedence):
 
@@ -128,6 +249,10 @@ def load():
     2. User-supplied config file
     3. Environment Variables
     4. CLI Parameters
+
+    The loaded configuration is used wherever no other configuration was activated.
+
+    :return: The loaded configuration
     """
     # Order is: file < environment < CLI (CLI takes precedence)
     config: Config = dict()
@@ -138,6 +263,9 @@ def load():
     # Load user-given config
     utils.combine_into(_load_user_config(), config)
 
+    global _merged, _loaded
+    _merged = copy.deepcopy(config)
+
     # Load ENV parameters
     envc = _load_env_config()
     utils.combine_into(envc, config)
@@ -145,10 +273,33 @@ def load():
     # Load CLI parameters
     utils.combine_into(_load_cli_params(), config)
 
-    global churchtools, youtube, wordpress, monitor_url
-    churchtools = config['churchtools']
-    youtube = config['youtube']
-    wordpress = config['wordpress']
-    monitor_url = config.get('monitor_url', None)
+    _loaded = _build_tenant(config)
 
     log.info('Configuration loaded.')
+    return _loaded
+
+
+# noinspection PyTypeChecker
+def load_tenant(tenant_file: TextIO) -> TenantConfig:
+    """
+    Load a tenant configuration file on top of the main configuration (see :py:func:`load`, which must be called first).
+
+    Environment variables (e.g. ``CTLA_CT_INSTANCE`` and ``CTLA_CT_TOKEN``) only apply to the main configuration,
+    as they would otherwise point all tenants to the same ChurchTools instance. CLI parameters still take precedence
+    over the tenant configuration.
+
+    :param tenant_file: The tenant configuration file.
+        The tenant is named after the ``name`` key, or the file name if it is not set.
+    :return: The loaded configuration
+    """
+    config: Config = copy.deepcopy(_merged)
+    tenant_config: Config = json.load(tenant_file)
+    utils.combine_into(tenant_config, config)
+    utils.combine_into(_load_cli_params(), config)
+
+    name = tenant_config.get('name') or Path(tenant_file.name).stem
+    if _load_env_config():
+        log.warning('Ignoring the configuration from environment variables for tenant "%s", '
+                    'it only applies to the main configuration.', name)
+    log.info('Configuration for tenant "%s" loaded.', name)
+    return _build_tenant(config, name)
@@ -3,6 +3,7 @@ Parse CLI arguments and hold them accessible for the application
 """
 import logging
 from argparse import ArgumentParser, Namespace, FileType
+from pathlib import Path
 
 log = logging.getLogger(__name__)
 
@@ -30,6 +31,96 @@ def _setup_parser() -> ArgumentParser:
         action='store_true',
         help='When given, displays available YouTube stream-keys and exits.'
     )
+    parser.add_argument(
+        '-t', '--tenant',
+        type=FileType('r', encoding='utf-8'),
+        action='append',
+        default=[],
+        help='Path to a tenant config file, which is applied on top of the main config file. '
+             'May be given multiple times to serve multiple tenants from one process.'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=4,
+        help='How many tenants to run concurrently. Defaults to 4.'
+    )
+    parser.add_argument(
+        '--interval',
+        type=float,
+        help='Run as daemon: start a new run every INTERVAL minutes instead of exiting after one run.'
+    )
+    parser.add_argument(
+        '--gc',
+        action='store_true',
+        help='Instead of synchronising, delete orphaned broadcasts and post links (once) and exit.'
+    )
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='With --gc: only report the orphans, without deleting anything.'
+    )
+    parser.add_argument(
+        '--history',
+        action='store_true',
+        help='Print a weekly summary (run times, requests, cache hit rates) of the run history and exit.'
+    )
+    cassette = parser.add_mutually_exclusive_group()
+    cassette.add_argument(
+        '--record',
+        metavar='CASSETTE',
+        type=Path,
+        help='Record all requests to ChurchTools, YouTube and WordPress and their responses in the file CASSETTE '
+             '(credentials are scrubbed).'
+    )
+    cassette.add_argument(
+        '--replay',
+        metavar='CASSETTE',
+        type=Path,
+        help='Answer all requests from the file CASSETTE recorded with --record, without using the network. '
+             'Fails if the writes differ from the recording.'
+    )
+    parser.add_argument(
+        '--replay-latency',
+        action='store_true',
+        help='With --replay: delay the responses by their recorded latency.'
+    )
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='Profile the CPU usage of the run(s) and write a pstats and a collapsed stacks file to PROFILE_DIR.'
+    )
+    parser.add_argument(
+        '--profile-mem',
+        action='store_true',
+        help='Profile the memory allocated in each phase of the run(s) with tracemalloc and write a report to '
+             'PROFILE_DIR.'
+    )
+    parser.add_argument(
+        '--profile-dir',
+        type=Path,
+        default=Path('.'),
+        help='Directory for the output of --profile and --profile-mem. Defaults to the current working directory.'
+    )
+    parser.add_argument(
+        '--log-level',
+        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+        default='INFO',
+        help='Minimum level of the log messages. Defaults to INFO.'
+    )
+    parser.add_argument(
+        '--log-json',
+        action='store_true',
+        help='Log JSON lines including the tenant, event and broadcast being handled, instead of plain text.'
+    )
+    parser.add_argument(
+        '--log-sample',
+        metavar='N',
+        type=int,
+        default=1,
+        help='Log only every N-th message of the chatty read-only per-request and per-event log statements. '
+             'Messages about writes are never sampled. Defaults to 1 (log all of them).'
+    )
     return parser
 
 
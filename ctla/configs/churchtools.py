@@ -1,5 +1,7 @@
 from typing import TypedDict, Optional, Literal
 
+from configs.response_cache import ResponseCacheConf
+
 
 class ManageStreamBehaviorConf(TypedDict):
     """
@@ -102,6 +104,15 @@ class ChurchToolsConf(TypedDict):
     """API Token string"""
     days_to_load: int
     """How many days to load in advance"""
+    window_days: int
+    """
+    Split the days to load into windows of this many days, which are fetched concurrently.
+    ``0`` loads all events with a single query
+    """
+    max_parallel_requests: int
+    """How many requests to run concurrently"""
+    response_cache: ResponseCacheConf
+    """Cache of responses that rarely change"""
 
     manage_stream_behavior_fact: ManageStreamBehaviorConf
     stream_visibility_fact: StreamVisibilityConf
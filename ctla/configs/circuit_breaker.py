@@ -0,0 +1,13 @@
+from typing import TypedDict
+
+
+class CircuitBreakerConf(TypedDict):
+    """
+    Configuration of the circuit breakers, which stop sending requests to an upstream (ChurchTools, YouTube or
+    WordPress) that keeps failing, so the stages not depending on it can still run
+    """
+
+    failure_threshold: int
+    """Consecutive failures (connection errors, timeouts, 5xx or 429 responses) after which requests are refused"""
+    reset_seconds: float
+    """How long requests are refused before a single probe request is let through"""
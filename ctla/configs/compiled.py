@@ -0,0 +1,157 @@
+"""
+Validated and precompiled form of the configuration, used for lookups on hot paths
+"""
+from collections.abc import Mapping
+from dataclasses import dataclass
+from string import Template
+from types import MappingProxyType
+from typing import Optional
+
+from ct.FactValues import ManageStreamBehavior, YtVisibility
+from .churchtools import ChurchToolsConf, BooleanFactConf
+from .wordpress import WordPressConf
+from .youtube import YouTubeConf
+
+
+@dataclass(frozen=True, slots=True)
+class FactLookup[T]:
+    """Lookup table translating the values of a ChurchTools fact"""
+
+    name: Optional[str]
+    """Name of the Fact, or ``None`` if it is not configured"""
+    values: Mapping[str, T]
+    """Mapping of fact value to parsed value"""
+    default: T
+    """Value to use if the fact is not set"""
+    strict: bool = False
+    """Whether unknown values raise a ``ValueError`` instead of falling back to the default"""
+
+    def parse(self, facts: Mapping[str, int | str]) -> T:
+        """Look up the value of this fact in the facts of an event"""
+        value = facts.get(self.name)
+        if value is None:
+            return self.default
+        try:
+            return self.values[value]
+        except KeyError:
+            if not self.strict:
+                return self.default
+            raise ValueError(
+                f'Unexpected Value for Fact "{self.name}": "{value}"\n'
+                f'Needs to be one of {', '.join(f'"{v}"' for v in self.values)}, according to configuration.'
+            )
+
+
+@dataclass(frozen=True, slots=True)
+class CompiledConfig:
+    """
+    Precompiled configuration values
+
+    Created once by :py:func:`config.load` so that parsing events only needs dictionary lookups
+    """
+
+    behavior_fact: FactLookup[ManageStreamBehavior]
+    visibility_fact: FactLookup[YtVisibility]
+    include_in_cal_fact: FactLookup[bool]
+    show_on_homepage_fact: FactLookup[bool]
+    create_post_fact: FactLookup[bool]
+
+    attachment_fields: Mapping[str, str]
+    """Mapping of event attachment name to the ``CtEvent`` field it is stored in"""
+    speaker_service_name: Optional[str]
+    """Name of the service containing the speaker"""
+
+    dateformat: str
+    speaker_short: Template
+    speaker_long: Template
+    yt_title: Template
+    yt_description: Template
+    post_title: Optional[Template]
+    post_content: Optional[Template]
+    wordpress_templates: Mapping[str, Template]
+    """WordPress content templates by key"""
+
+
+def _compile_choice_fact[T](conf: Mapping[str, str], values: dict[str, T], conf_name: str,
+                            strict: bool) -> FactLookup[T]:
+    """
+    Compile a fact with multiple choices
+
+    :param conf: The fact configuration
+    :param values: Mapping of configuration key (e.g. ``yes_value``) to parsed value
+    :param conf_name: Name of the configuration entry, for error messages
+    :param strict: Whether unknown values raise an error
+    :raise ValueError: if the configured default does not match any of the values
+    """
+    table = {conf[key]: value for key, value in values.items()}
+    try:
+        default = table[conf['default']]
+    except KeyError:
+        raise ValueError(f'Config value for "churchtools.{conf_name}.default" must match one of '
+                         f'the given values for {', '.join(values)}')
+    return FactLookup(name=conf['name'], values=MappingProxyType(table), default=default, strict=strict)
+
+
+def _compile_boolean_fact(conf: Optional[BooleanFactConf]) -> FactLookup[bool]:
+    """Compile a boolean fact. Unconfigured facts always evaluate to ``False``"""
+    if conf is None:
+        return FactLookup(name=None, values=MappingProxyType({}), default=False)
+    return FactLookup(
+        name=conf['name'],
+        values=MappingProxyType({conf['yes_value']: True, conf['no_value']: False}),
+        default=conf['default']
+    )
+
+
+def compile_config(churchtools: ChurchToolsConf, youtube: YouTubeConf, wordpress: WordPressConf) -> CompiledConfig:
+    """
+    Validate the configuration and precompute lookup tables and templates
+
+    :raise ValueError: if the configuration is invalid
+    """
+    post_settings = churchtools.get('post_settings')
+    attachment_fields = {
+        churchtools.get('thumbnail_name'): 'yt_thumbnail',
+        churchtools['stream_attachment_name']: 'yt_link',
+    }
+    if post_settings:
+        attachment_fields.setdefault(post_settings['attachment_name'], 'post_link')
+    attachment_fields.pop(None, None)
+
+    return CompiledConfig(
+        behavior_fact=_compile_choice_fact(
+            churchtools['manage_stream_behavior_fact'],
+            {
+                'yes_value': ManageStreamBehavior.YES,
+                'ignore_value': ManageStreamBehavior.IGNORE,
+                'no_value': ManageStreamBehavior.NO
+            },
+            'manage_stream_behavior_fact',
+            strict=False
+        ),
+        visibility_fact=_compile_choice_fact(
+            churchtools['stream_visibility_fact'],
+            {
+                'visible_value': YtVisibility.VISIBLE,
+                'unlisted_value': YtVisibility.UNLISTED,
+                'private_value': YtVisibility.PRIVATE
+            },
+            'stream_visibility_fact',
+            strict=True
+        ),
+        include_in_cal_fact=_compile_boolean_fact(churchtools.get('include_in_cal_fact')),
+        show_on_homepage_fact=_compile_boolean_fact(churchtools.get('show_on_homepage_fact')),
+        create_post_fact=_compile_boolean_fact(churchtools.get('create_post_fact')),
+        attachment_fields=MappingProxyType(attachment_fields),
+        speaker_service_name=churchtools.get('speaker_service_name'),
+        dateformat=churchtools['templates']['dateformat'],
+        speaker_short=Template(churchtools['templates']['speaker']['short']),
+        speaker_long=Template(churchtools['templates']['speaker']['long']),
+        yt_title=Template(youtube['templates']['title']),
+        yt_description=Template(youtube['templates']['description']),
+        post_title=Template(post_settings.get('title', youtube['templates']['title'])) if post_settings else None,
+        post_content=Template(post_settings['content']) if post_settings else None,
+        wordpress_templates=MappingProxyType({
+            key: Template(template) for key, template in wordpress.get('content_templates', {}).items()
+        })
+    )
@@ -0,0 +1,17 @@
+from typing import TypedDict
+
+
+class GcConf(TypedDict):
+    """
+    Configuration of the garbage collector removing orphaned broadcasts and links (``--gc``)
+    """
+
+    days_to_load: int
+    """
+    How many days of events to scan for references.
+    Broadcasts scheduled beyond this horizon are never considered orphaned
+    """
+    batch_size: int
+    """How many orphans to delete before pausing"""
+    batch_delay: float
+    """Pause between two batches of deletions in seconds"""
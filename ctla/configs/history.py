@@ -0,0 +1,20 @@
+from typing import TypedDict
+
+
+class HistoryConf(TypedDict):
+    """
+    Configuration of the local history of run records (summarized with ``--history``)
+    """
+
+    enabled: bool
+    """Append a JSON record with the stats of every run to the history"""
+    filename: str
+    """
+    Filename of the history (JSON lines).
+    May be absolute, otherwise relative to ``tempfile.gettempdir()``
+    (prefixed with the tenant name when running multiple tenants)
+    """
+    max_megabytes: float
+    """Size above which the history is rotated (``<filename>.1``, ``<filename>.2``, …)"""
+    backups: int
+    """Number of rotated files to keep"""
@@ -0,0 +1,14 @@
+from typing import TypedDict
+
+
+class JournalConf(TypedDict):
+    """
+    Configuration of the write-ahead journal of operations that take multiple requests (creating broadcasts and posts)
+    """
+
+    filename: str
+    """
+    Filename of the journal. Operations interrupted by a crash are resumed or rolled back from it on the next run.
+    May be absolute, otherwise relative to ``tempfile.gettempdir()``
+    (prefixed with the tenant name when running multiple tenants)
+    """
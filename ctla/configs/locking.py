@@ -0,0 +1,20 @@
+from typing import TypedDict
+
+
+class LockingConf(TypedDict):
+    """
+    Configuration of the leases coordinating multiple workers (containers, daemon replicas or overlapping cron runs)
+    """
+
+    enabled: bool
+    """
+    Acquire a lease for each tenant and event before processing it.
+    Tenants and events leased by another worker are skipped; overlapping runs of a tenant are coalesced into one rerun.
+    """
+    database: str
+    """
+    Filename of the SQLite database holding the leases. Must be shared by all workers (e.g. on a shared volume).
+    May be absolute, otherwise relative to ``tempfile.gettempdir()``
+    """
+    lease_seconds: int
+    """How long a lease is valid without being renewed, so that crashed workers release their tenants and events"""
@@ -0,0 +1,12 @@
+from typing import TypedDict
+
+
+class MonitorConf(TypedDict):
+    """
+    Configuration of the reports to the external monitor at ``monitor_url``
+    """
+
+    timeout: float
+    """Timeout of each report in seconds. Reports are sent in the background and never delay a run"""
+    heartbeat_seconds: float
+    """Send an ``up`` report with the current stage every this many seconds while a run is going on. ``0`` disables"""
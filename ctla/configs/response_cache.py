@@ -0,0 +1,24 @@
+from typing import TypedDict
+
+
+class ResponseCacheConf(TypedDict):
+    """
+    Configuration of the on-disk cache of ChurchTools responses, shared by all runs and the helper scripts in ``tools``
+    """
+
+    enabled: bool
+    """Cache the responses of GET requests to the paths listed in :py:attr:`ttl`"""
+    filename: str
+    """
+    Filename of the SQLite database holding the responses.
+    May be absolute, otherwise relative to ``tempfile.gettempdir()``
+    (prefixed with the tenant name when running multiple tenants)
+    """
+    max_megabytes: float
+    """Size of all cached response bodies, above which the least recently used responses are evicted"""
+    ttl: dict[str, int]
+    """
+    How many seconds responses may be reused, per API path pattern (``fnmatch`` syntax, e.g. ``/events/*/facts``).
+    Responses to other paths (or with a TTL of ``0``) are not cached. A ``max-age`` sent by the server shortens the TTL.
+    Expired responses with an ``ETag`` or ``Last-Modified`` header are revalidated instead of fetched again.
+    """
@@ -0,0 +1,24 @@
+from typing import TypedDict
+
+
+class TimeoutConf(TypedDict):
+    """
+    Timeouts of outbound requests and the deadline of a run
+    """
+
+    connect: float
+    """Timeout for establishing a connection to ChurchTools, WordPress or a thumbnail host in seconds"""
+    read: float
+    """Timeout for waiting on data from any API in seconds"""
+    run_seconds: float
+    """
+    Deadline of a run (for all tenants), counted from its start. ``0`` disables the deadline.
+    Events that could not be handled before the deadline are deferred to the next run
+    """
+    reserve_seconds: float
+    """
+    When less than this many seconds are left until the deadline, low-priority work is deferred:
+    WordPress pages, posts and events starting after :py:attr:`priority_days`
+    """
+    priority_days: float
+    """Events starting within this many days are handled until the deadline is reached"""
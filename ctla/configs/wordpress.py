@@ -58,3 +58,11 @@ class WordPressConf(TypedDict):
     It is recommended to use the `Timed Content <https://wordpress.org/plugins/timed-content/>`__ plugin
     or something similar to select when the different streams are displayed
     """
+    page_cache: str
+    """
+    Filename of a temporary file caching the last published state of each page, to skip fetching unchanged pages.
+    May be absolute, otherwise relative to ``tempfile.gettempdir()``
+    (prefixed with the tenant name when running multiple tenants)
+    """
+    max_parallel_requests: int
+    """How many pages to fetch and update concurrently"""
@@ -59,7 +59,12 @@ class YouTubeConf(TypedDict):
     client_secrets_file: str
     """Path to the file containing the Google API client secret"""
     credentials_file: str
-    """Path where the app stores the API Tokens received from Google"""
+    """
+    Path where the app stores the API Tokens received from Google.
+    The access token and its expiry are saved after every refresh and shared by all workers using the file
+    """
+    token_refresh_margin: int
+    """Refresh the access token at the start of a run if it expires within this many seconds"""
     templates: YouTubeTemplateConf
     """Template configuration for YouTube title / description"""
     default_thumbnail_uri: str
@@ -82,4 +87,17 @@ class YouTubeConf(TypedDict):
     """
     Filename of a temporary file caching thumbnail information to avoid hitting YouTube rate limits.
     May be absolute, otherwise relative to ``tempfile.gettempdir()``
+    (prefixed with the tenant name when running multiple tenants)
+    """
+    etag_cache: str
+    """
+    Filename of a temporary file caching the responses of list requests with their ETags,
+    so unchanged lists and broadcasts are not transferred again.
+    May be absolute, otherwise relative to ``tempfile.gettempdir()``
+    (prefixed with the tenant name when running multiple tenants)
+    """
+    quota_per_run: int
+    """
+    Maximum number of YouTube API quota units a single run may use. ``0`` disables the limit.
+    Events that do not fit into the quota are deferred to the next run.
     """
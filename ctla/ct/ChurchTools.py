@@ -1,13 +1,18 @@
 import datetime
 import logging
+import operator
 import urllib.parse
 from collections.abc import Generator
 from datetime import timedelta
 from typing import Any, Optional
 
 import config
+import logs
+import utils
 from RestAPI import RestAPI
+from breaker import CircuitBreaker
 from configs.churchtools import PostVisibility
+from response_cache import ResponseCache
 from .CtEvent import CtEvent
 from .EventFile import EventFile, EventFileType
 
@@ -45,6 +50,8 @@ class ChurchTools(RestAPI):
 
         self.urlbase = urllib.parse.urlunsplit(('https', instance, '/api', '', ''))
         self._headers = {'Authorization': f'Login {token}'}
+        self.breaker = CircuitBreaker('ChurchTools')
+        self.response_cache = ResponseCache.from_config(config.churchtools['response_cache'])
 
         log.info('Initialized ChurchTools API.')
 
@@ -74,9 +81,17 @@ class ChurchTools(RestAPI):
             self._services_cache = {service['name']: service['id'] for service in r.json()['data']}
         return self._services_cache
 
+    @property
+    def speaker_service_id(self) -> Optional[int]:
+        """ID of the service containing the speaker, or ``None`` if no speaker service is configured"""
+        name = config.compiled.speaker_service_name
+        if name is None:
+            return None
+        return self.service_mdata[name]
+
     def get_event_facts(self, event_id: int) -> dict[str, int | str]:
         """Get the facts for the event with id `event_id`, as dict"""
-        log.info('Collecting event facts…')
+        log.info('Collecting event facts…', extra=logs.SAMPLED)
         r = self._do_get(f'/events/{event_id}/facts')
         if r.status_code != 200:
             log.error(f'Response error when fetching facts for {event_id} [{r.status_code}]: "{r.content}"')
@@ -84,27 +99,100 @@ class ChurchTools(RestAPI):
 
         return {self.fact_mdata[fact['factId']]: fact['value'] for fact in r.json()['data']}
 
-    def get_upcoming_events(self, days: int) -> Generator[CtEvent]:
+    def get_upcoming_events[E: CtEvent](self, days: int, event_type: type[E] = CtEvent) -> Generator[E]:
         """
         Load and return events from ChurchTools
+
+        If ``churchtools.window_days`` is set, the horizon is split into windows of that many days,
+        which are fetched concurrently. Events are yielded window by window (near-term first) in start time order.
+        Events overlapping multiple windows are only yielded once.
+
         :param days: How many days to load in advance (including the current day)
+        :param event_type: The class to decode the events into (``CtEvent`` or a subclass)
         :return: A generator creating the events
         :raise HttpError (directly passed down from the requests module) if an error occurred
         """
-        # Compute date instance for filter end date
-        from_limit = (datetime.date.today() - timedelta(days=1)).isoformat()
-        to_limit = (datetime.date.today() + timedelta(days=days)).isoformat()
+        # Compute dates for filter
+        from_date = datetime.date.today() - timedelta(days=1)
+        to_date = datetime.date.today() + timedelta(days=days)
+
+        window_days = config.churchtools.get('window_days') or 0
+        if window_days <= 0 or (to_date - from_date).days < window_days:
+            log.info('Retrieving upcoming event data…')
+            yield from self._get_events(from_date, to_date, event_type)
+            return
+
+        windows = _date_windows(from_date, to_date, window_days)
+        log.info('Retrieving upcoming event data in %s windows…', len(windows))
+
+        # Populate masterdata caches once before fetching concurrently
+        _ = self.fact_mdata
+        _ = self.speaker_service_id
+
+        seen: set[int] = set()
+        with utils.ContextThreadPoolExecutor(max_workers=config.churchtools['max_parallel_requests']) as executor:
+            futures = [executor.submit(self._get_window_events, start, end, event_type) for start, end in windows]
+            for future in futures:
+                for event in future.result():
+                    if event.id not in seen:
+                        seen.add(event.id)
+                        yield event
+
+    def _get_window_events[E: CtEvent](self, from_date: datetime.date, to_date: datetime.date,
+                                       event_type: type[E]) -> list[E]:
+        """Load the events of one date window, sorted by start time"""
+        events = sorted(self._get_events(from_date, to_date, event_type), key=operator.attrgetter('start_time'))
+        log.debug('Retrieved %d event(s) between %s and %s', len(events), from_date, to_date)
+        return events
+
+    def _get_events[E: CtEvent](self, from_date: datetime.date, to_date: datetime.date,
+                                event_type: type[E]) -> Generator[E]:
+        """
+        Load the events between ``from_date`` and ``to_date`` (inclusive) with a single query
+        """
+        params = {
+            'canceled': True,
+            'from': from_date.isoformat(),
+            'to': to_date.isoformat()
+        }
+        # Services are only needed to find the speaker
+        if self.speaker_service_id is not None:
+            params['include'] = 'eventServices'
+
+        r = self._do_get('/events', **params)
+        if r.status_code != 200:
+            log.error('Response error when fetching upcoming events [%s]: "%s"', r.status_code, r.content)
+            r.raise_for_status()
+
+        data = r.json()['data']
+        facts = {event['id']: self.get_event_facts(event['id']) for event in data}
+        yield from event_type.from_api_json_batch(data, facts, self.speaker_service_id)
+
+    def get_event_attachments(self, days: int) -> dict[int, list[EventFile]]:
+        """
+        Load the attachments managed by CTLA (see ``CompiledConfig.attachment_fields``) of all upcoming events,
+        without loading facts or services
 
-        log.info('Retrieving upcoming event data…')
-        r = self._do_get('/events', canceled=True, **{'from': from_limit}, to=to_limit, include='eventServices')
+        :param days: How many days to load in advance (including the current day)
+        :return: The attachments by event ID. Events without such attachments are omitted.
+        """
+        log.info('Retrieving event attachments for the next %s days…', days)
+        r = self._do_get('/events', **{
+            'canceled': True,
+            'from': (datetime.date.today() - timedelta(days=1)).isoformat(),
+            'to': (datetime.date.today() + timedelta(days=days)).isoformat()
+        })
         if r.status_code != 200:
             log.error(f'Response error when fetching upcoming events [{r.status_code}]: "{r.content}"')
             r.raise_for_status()
 
+        attachment_fields = config.compiled.attachment_fields
+        attachments = {}
         for event in r.json()['data']:
-            facts = self.get_event_facts(event['id'])
-            # noinspection PyTypeChecker
-            yield CtEvent.from_api_json(event, facts, self.service_mdata)
+            files = [EventFile.from_event_api_json(f) for f in event['eventFiles'] if f['title'] in attachment_fields]
+            if files:
+                attachments[event['id']] = files
+        return attachments
 
     def attach_link(self, event: CtEvent, name: str, link: str) -> Optional[EventFile]:
         """
@@ -119,6 +207,8 @@ class ChurchTools(RestAPI):
             'name': name,
             'url': link
         })
+        # The attachments are part of the event data
+        self._invalidate('/events', f'/events/{event.id}')
 
         log.info(f'Attaching link "name" ({link}) to "{event.title}" ({event.id})')
         if r.status_code != 201:
@@ -142,6 +232,7 @@ class ChurchTools(RestAPI):
         """
         log.info(f'Deleting event link {link_id}')
         r = self._do_delete(f'/files/{link_id}')
+        self._invalidate('/events')
         if r.status_code != 204:
             log.error(f'Error when deleting event link on ChurchTools [{r.status_code}]: "{r.content}"')
             r.raise_for_status()
@@ -179,7 +270,7 @@ class ChurchTools(RestAPI):
             log.error(f'Error creating post on ChurchTools [{r.status_code} - {r.reason}]: "{r.content}"')
             r.raise_for_status()
         post_id = int(r.json()['data']['id'])
-        log.debug(f'Created post with id {post_id}')
+        log.debug('Created post with id %s', post_id)
         return post_id
 
     def get_post(self, post_id: int) -> dict:
@@ -189,13 +280,61 @@ class ChurchTools(RestAPI):
         :param post_id: ID of the post to get
         :return: The post data
         """
-        log.info(f'Fetching post {post_id}')
+        log.info('Fetching post %s', post_id, extra=logs.SAMPLED)
         r = self._do_get(f'/posts/{post_id}')
         if r.status_code != 200:
             log.error(f'Could not fetch post {post_id}: [{r.status_code} - {r.reason}] "{r.content}"')
             r.raise_for_status()
         return r.json()['data']
 
+    def post_exists(self, post_id: int) -> bool:
+        """
+        Check whether a post exists
+
+        :param post_id: ID of the post to look up
+        :return: False if ChurchTools reports the post as not found
+        """
+        r = self._do_get(f'/posts/{post_id}')
+        if r.status_code == 404:
+            return False
+        if r.status_code != 200:
+            log.error('Could not fetch post %s: [%s - %s] "%s"', post_id, r.status_code, r.reason, r.content)
+            r.raise_for_status()
+        return True
+
+    def get_posts(self, group_id: int, post_ids: set[int], limit: int = 100, max_pages: int = 2) -> dict[int, dict]:
+        """
+        Fetch multiple posts of a group from ChurchTools in bulk
+
+        Pages through the posts of the group until all requested posts were found, no posts are left or
+        ``max_pages`` pages were fetched. A single deleted or moved post would otherwise page through the whole group,
+        so callers look up the missing posts individually instead.
+
+        :param group_id: ID of the group the posts were published in
+        :param post_ids: IDs of the posts to get
+        :param limit: How many posts to fetch per request
+        :param max_pages: How many requests to send at most
+        :return: The post data of the found posts (id : data). Posts that were not found are omitted.
+        """
+        log.info('Fetching %s post(s) of group %s', len(post_ids), group_id)
+        posts = {}
+        page = 1
+        while len(posts) < len(post_ids) and page <= max_pages:
+            r = self._do_get('/posts', **{'group_ids[]': group_id}, page=page, limit=limit)
+            if r.status_code != 200:
+                log.error('Could not fetch posts of group %s: [%s - %s] "%s"', group_id, r.status_code, r.reason,
+                          r.content)
+                r.raise_for_status()
+
+            response = r.json()
+            posts |= {post['id']: post for post in response['data'] if post['id'] in post_ids}
+
+            pagination = response.get('meta', {}).get('pagination', {})
+            if len(response['data']) < limit or page >= pagination.get('lastPage', page + 1):
+                break
+            page += 1
+        return posts
+
     def update_post(self, post_id: int, data: dict[str, Any]):
         """
         Update a post with the given parameters.
@@ -205,6 +344,7 @@ class ChurchTools(RestAPI):
         :param data: The new post data
         """
         r = self._do_patch(f'/posts/{post_id}', data)
+        self._invalidate('/posts')
         if r.status_code != 200:
             log.error(f'Could not update post {post_id}: [{r.status_code} - {r.reason}] "{r.content}"')
             r.raise_for_status()
@@ -219,6 +359,7 @@ class ChurchTools(RestAPI):
         """
         log.info(f'Deleting post {post_id}')
         r = self._do_delete(f'/posts/{post_id}')
+        self._invalidate('/posts')
         if r.status_code != 204:
             log.error(f'Error when deleting post on ChurchTools [{r.status_code}]: "{r.content}"')
             r.raise_for_status()
@@ -250,3 +391,22 @@ class ChurchTools(RestAPI):
         raise NotImplementedError
         appointment = self.get_calendar_entry(event)
         appointment['link'] = link
+
+
+def _date_windows(from_date: datetime.date, to_date: datetime.date,
+                  window_days: int) -> list[tuple[datetime.date, datetime.date]]:
+    """
+    Split the date range into consecutive, non-overlapping windows
+
+    :param from_date: First day of the range
+    :param to_date: Last day of the range (inclusive)
+    :param window_days: Length of each window in days
+    :return: The ``(first, last)`` days of each window (inclusive), in chronological order
+    """
+    windows = []
+    start = from_date
+    while start <= to_date:
+        end = min(start + timedelta(days=window_days - 1), to_date)
+        windows.append((start, end))
+        start = end + timedelta(days=1)
+    return windows
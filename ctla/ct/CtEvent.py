@@ -1,14 +1,15 @@
 import typing
+from collections.abc import Iterable, Mapping
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Self
 
 import config
 from .EventFile import EventFile
 from .Facts import Facts
 
 
-@dataclass
+@dataclass(slots=True)
 class CtEvent:
     """Class holding data about an Event"""
     id: int
@@ -33,33 +34,32 @@ class CtEvent:
             cls,
             event: dict[str, typing.Any],
             facts: dict[str, int | str],
-            service_mdata: dict[str, int]
-    ) -> 'CtEvent':
+            speaker_service_id: Optional[int]
+    ) -> Self:
         """
         Create instance from API results
+
+        Subclasses are constructed directly, so ``Event.from_api_json`` creates an ``Event``.
         :param event: Result from /events
         :param facts: Result from /events/`ID`/facts
-        :param service_mdata: Service masterdata to correlate service IDs to names
+        :param speaker_service_id: ID of the service containing the speaker's name
         :return:
         """
         # Find attached files we care about
-        yt_link_data = next(
-            (f for f in event['eventFiles'] if f['title'] == config.churchtools['stream_attachment_name']), None
-        )
-        yt_thumb_data = next(
-            (f for f in event['eventFiles'] if f['title'] == config.churchtools['thumbnail_name']), None
-        )
-        post_link_data = next(
-            (f for f in event['eventFiles']
-             if f['title'] == config.churchtools.get('post_settings', {}).get('attachment_name')), None
-        )
+        attachment_fields = config.compiled.attachment_fields
+        files: dict[str, dict[str, typing.Any]] = {}
+        for f in event['eventFiles']:
+            field = attachment_fields.get(f['title'])
+            if field:
+                files.setdefault(field, f)
 
         # Get services
         speaker = None
-        for service in event.get('eventServices', []):
-            if service['serviceId'] == service_mdata[config.churchtools['speaker_service_name']]:
-                speaker = service['name']
-                break
+        if speaker_service_id is not None:
+            for service in event.get('eventServices', []):
+                if service['serviceId'] == speaker_service_id:
+                    speaker = service['name']
+                    break
 
         return cls(
             id=event['id'],
@@ -72,7 +72,21 @@ class CtEvent:
             isCanceled=event['isCanceled'],
             speaker=speaker,
             facts=Facts.from_api_json(facts),
-            yt_link=EventFile.from_event_api_json(yt_link_data) if yt_link_data else None,
-            yt_thumbnail=EventFile.from_event_api_json(yt_thumb_data) if yt_thumb_data else None,
-            post_link=EventFile.from_event_api_json(post_link_data) if post_link_data else None
+            **{field: EventFile.from_event_api_json(f) for field, f in files.items()}
         )
+
+    @classmethod
+    def from_api_json_batch(
+            cls,
+            events: Iterable[dict[str, typing.Any]],
+            facts: Mapping[int, dict[str, int | str]],
+            speaker_service_id: Optional[int]
+    ) -> list[Self]:
+        """
+        Create instances from a whole page of API results at once
+        :param events: Results from /events
+        :param facts: Results from /events/`ID`/facts, by event ID
+        :param speaker_service_id: ID of the service containing the speaker's name
+        :return: The events, in the order given
+        """
+        return [cls.from_api_json(event, facts[event['id']], speaker_service_id) for event in events]
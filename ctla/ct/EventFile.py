@@ -10,7 +10,7 @@ class EventFileType(Enum):
     FILE = 'file'
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class EventFile:
     """ChurchTools Event Attachment Information"""
     id: int
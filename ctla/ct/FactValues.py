@@ -0,0 +1,13 @@
+from enum import Enum, auto
+
+
+class ManageStreamBehavior(Enum):
+    YES = auto()
+    NO = auto()
+    IGNORE = auto()
+
+
+class YtVisibility(Enum):
+    VISIBLE = auto()
+    UNLISTED = auto()
+    PRIVATE = auto()
@@ -1,29 +1,31 @@
 """
 Dataclasses that combine information from different sources
 """
+import contextlib
 import logging
 import string
+import time
 import urllib.parse
-from dataclasses import dataclass
-from string import Template
+from dataclasses import dataclass, field
 from typing import Optional
 
 import config
+import profiling
 from ct.CtEvent import CtEvent
 from ct.Facts import ManageStreamBehavior, YtVisibility
-from yt.type_hints import LiveBroadcast
+from yt.Broadcast import Broadcast
 from yt.type_hints import PrivacyStatus
 
 log = logging.getLogger(__name__)
 
 
-@dataclass
+@dataclass(slots=True)
 class Event(CtEvent):
     """
     Extension of `CtEvent`, containing a reference to YouTube
     """
     # Attached broadcast
-    yt_broadcast: Optional[LiveBroadcast] = None
+    yt_broadcast: Optional[Broadcast] = None
 
     @property
     def wants_stream(self):
@@ -42,15 +44,7 @@ class Event(CtEvent):
         """
         if not self.yt_link:
             return None
-
-        query = urllib.parse.urlparse(self.yt_link.url)
-        if query.hostname == 'youtu.be':
-            return query.path[1:]  # youtu.be-Links have the ID as path
-        elif query.hostname.endswith('youtube.com'):
-            match = urllib.parse.parse_qs(query.query)['v'][0]
-            if _is_video_id(match):
-                return match
-        return None
+        return parse_video_id(self.yt_link.url)
 
     @property
     def yt_visibility(self) -> PrivacyStatus:
@@ -66,12 +60,12 @@ class Event(CtEvent):
     @property
     def yt_title(self) -> str:
         """Apply the YouTube title template configured"""
-        return Template(config.youtube['templates']['title']).safe_substitute(**self._substitution_vars).strip()
+        return config.compiled.yt_title.safe_substitute(**self._substitution_vars).strip()
 
     @property
     def yt_description(self) -> str:
         """Apply the YouTube description template configured"""
-        return Template(config.youtube['templates']['description']).safe_substitute(**self._substitution_vars).strip()
+        return config.compiled.yt_description.safe_substitute(**self._substitution_vars).strip()
 
     @property
     def post_id(self) -> int:
@@ -81,40 +75,35 @@ class Event(CtEvent):
         :return: The ID
         :raise RuntimeError: if any error occurs (post_link not set, unable to extract ID from URL)
         """
-        try:
-            return int(self.post_link.url.split('/')[-1])
-        except ValueError:
+        post_id = parse_post_id(self.post_link.url)
+        if post_id is None:
             log.error(f'Could not parse post id from "{self.post_link.url}"')
             raise RuntimeError
+        return post_id
 
     @property
     def post_title(self) -> str:
         """Apply the post title template configured"""
-        return Template(
-            config.churchtools['post_settings']
-            .get('title', config.youtube['templates']['title'])
-        ).safe_substitute(
+        return config.compiled.post_title.safe_substitute(
             **self._substitution_vars | {'link': self.yt_link.url}
         ).strip()
 
     @property
     def post_content(self) -> str:
         """Apply the post description template configured"""
-        return Template(
-            config.churchtools['post_settings']['content']
-        ).safe_substitute(
+        return config.compiled.post_content.safe_substitute(
             **self._substitution_vars | {'link': self.yt_link.url}
         ).strip()
 
     @property
     def _substitution_vars(self) -> dict[str, str]:
         """Pack the variables available in templates into one dict"""
-        fmt_start = self.start_time.strftime(config.churchtools['templates']['dateformat'])
-        fmt_end = self.end_time.strftime(config.churchtools['templates']['dateformat'])
+        compiled = config.compiled
+        fmt_start = self.start_time.strftime(compiled.dateformat)
+        fmt_end = self.end_time.strftime(compiled.dateformat)
 
-        spkr_tmplt = config.churchtools['templates']['speaker']
-        speaker_short = Template(spkr_tmplt['short']).safe_substitute(name=self.speaker) if self.speaker else ''
-        speaker_long = Template(spkr_tmplt['long']).safe_substitute(name=self.speaker) if self.speaker else ''
+        speaker_short = compiled.speaker_short.safe_substitute(name=self.speaker) if self.speaker else ''
+        speaker_long = compiled.speaker_long.safe_substitute(name=self.speaker) if self.speaker else ''
 
         return dict(
             title=self.title,
@@ -134,6 +123,60 @@ class RuntimeStats:
     updated: int = 0
     deleted: int = 0
     skipped: int = 0
+    relinked: int = 0
+    """Events whose existing broadcast was re-linked instead of creating a new one"""
+    yt_conditional: int = 0
+    """YouTube list requests sent with ``If-None-Match``"""
+    yt_not_modified: int = 0
+    """YouTube list requests answered from the ETag cache"""
+    requests_sent: dict[str, int] = field(default_factory=dict)
+    """Number of API requests per upstream (``churchtools``, ``youtube``, ``wordpress``)"""
+    bytes_received: dict[str, int] = field(default_factory=dict)
+    """Size of the response bodies received per upstream"""
+    request_seconds: dict[str, float] = field(default_factory=dict)
+    """Time spent waiting for responses per upstream"""
+    ct_cache_lookups: int = 0
+    """ChurchTools GET requests to paths cached in the response cache"""
+    ct_cached: int = 0
+    """ChurchTools GET requests answered from the response cache"""
+    yt_quota_used: int = 0
+    """YouTube quota units used"""
+    degraded: list[str] = field(default_factory=list)
+    """Stages that were skipped or not completed because an upstream failed"""
+    phases: dict[str, float] = field(default_factory=dict)
+    """Duration of each phase of the run in seconds, see :py:meth:`phase`"""
+    stage: str = ''
+    """Description of the current stage, used to report where a failure occurred"""
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """Context manager adding the time spent inside it to the duration of phase ``name``"""
+        start = time.perf_counter()
+        try:
+            with profiling.memory_phase(name):
+                yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+
+def parse_video_id(url: str) -> Optional[str]:
+    """Parse the YouTube video id out of a ``youtu.be`` or ``youtube.com/watch`` URL"""
+    query = urllib.parse.urlparse(url)
+    if query.hostname == 'youtu.be':
+        return query.path[1:]  # youtu.be-Links have the ID as path
+    elif query.hostname.endswith('youtube.com'):
+        match = urllib.parse.parse_qs(query.query)['v'][0]
+        if _is_video_id(match):
+            return match
+    return None
+
+
+def parse_post_id(url: str) -> Optional[int]:
+    """Parse the post ID out of a post link (``…/posts/<id>``)"""
+    try:
+        return int(url.split('/')[-1])
+    except ValueError:
+        return None
 
 
 def _is_video_id(match: str):
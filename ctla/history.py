@@ -0,0 +1,153 @@
+"""
+Machine-readable records of all runs, kept in a local history (JSON lines) and summarized with ``--history``
+"""
+import datetime
+import json
+import logging
+import math
+import threading
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Any
+
+import config
+from data import RuntimeStats
+
+log = logging.getLogger(__name__)
+
+type RunRecord = dict[str, Any]
+
+_lock = threading.Lock()
+"""Serializes writing and rotating the histories"""
+
+
+def build_record(tenant: str, stats: RuntimeStats, status: str, started: datetime.datetime,
+                 duration: float) -> RunRecord:
+    """
+    Create the record of a run
+
+    :param tenant: Name of the tenant
+    :param stats: The stats of the run
+    :param status: ``ok``, ``degraded`` or ``failed``
+    :param started: Start of the run
+    :param duration: Duration of the run in seconds
+    :return: The record (JSON serializable)
+    """
+    return {
+        'tenant': tenant,
+        'started': started.isoformat(timespec='seconds'),
+        'status': status,
+        'duration': round(duration, 3),
+        'phases': {phase: round(seconds, 3) for phase, seconds in stats.phases.items()},
+        'events': {
+            'total': stats.total,
+            'new': stats.new,
+            'updated': stats.updated,
+            'deleted': stats.deleted,
+            'relinked': stats.relinked,
+            'skipped': stats.skipped
+        },
+        'upstreams': {
+            upstream: {
+                'requests': requests_sent,
+                'bytes': stats.bytes_received.get(upstream, 0),
+                'seconds': round(stats.request_seconds.get(upstream, 0.0), 3)
+            }
+            for upstream, requests_sent in stats.requests_sent.items()
+        },
+        'caches': {
+            'youtube_etag': {'lookups': stats.yt_conditional, 'hits': stats.yt_not_modified},
+            'churchtools_responses': {
+                'lookups': stats.ct_cache_lookups,
+                'hits': stats.ct_cached
+            }
+        },
+        'yt_quota_used': stats.yt_quota_used,
+        'degraded': stats.degraded
+    }
+
+
+def _path() -> Path:
+    return config.temp_path(config.history['filename'])
+
+
+def append(record: RunRecord):
+    """Append the record to the history of the active configuration, rotating it if it got too large"""
+    if not config.history['enabled']:
+        return
+    path = _path()
+    with _lock:
+        if path.exists() and path.stat().st_size >= config.history['max_megabytes'] * 1024 * 1024:
+            _rotate(path, config.history['backups'])
+        with path.open('a') as f:
+            f.write(json.dumps(record) + '\n')
+
+
+def _rotate(path: Path, backups: int):
+    """Shift ``<path>.1`` … ``<path>.<backups - 1>`` by one and move the history to ``<path>.1``"""
+    for i in range(backups - 1, 0, -1):
+        backup = path.with_name(f'{path.name}.{i}')
+        if backup.exists():
+            backup.replace(path.with_name(f'{path.name}.{i + 1}'))
+    if backups > 0:
+        path.replace(path.with_name(f'{path.name}.1'))
+    else:
+        path.unlink()
+    log.info('Rotated run history %s', path)
+
+
+def load() -> list[RunRecord]:
+    """Read the history of the active configuration, including the rotated files, oldest first"""
+    path = _path()
+    files = [path.with_name(f'{path.name}.{i}') for i in range(config.history['backups'], 0, -1)] + [path]
+    records = []
+    for file in files:
+        if not file.exists():
+            continue
+        for line in file.read_text().splitlines():
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # The last line may be incomplete if the process died while writing it
+                log.warning('Ignoring malformed history entry in %s: %r', file, line)
+    return records
+
+
+def summarize(records: Iterable[RunRecord]) -> str:
+    """
+    Summarize the records per ISO week: number of runs, failed or degraded runs,
+    median and 95th percentile of the run time, requests per run and cache hit rates
+
+    :return: A table
+    """
+    weeks: dict[str, list[RunRecord]] = {}
+    for record in records:
+        year, week, _ = datetime.datetime.fromisoformat(record['started']).isocalendar()
+        weeks.setdefault(f'{year}-W{week:02}', []).append(record)
+
+    lines = [f'{'week':<8} {'runs':>5} {'not ok':>6} {'p50 s':>8} {'p95 s':>8} {'requests':>8} '
+             f'{'yt-etag':>7} {'ct-cache':>8}']
+    for week, week_records in sorted(weeks.items()):
+        durations = [record['duration'] for record in week_records]
+        requests = sum(upstream['requests'] for record in week_records for upstream in record['upstreams'].values())
+        lines.append(
+            f'{week:<8} {len(week_records):>5} '
+            f'{sum(record['status'] != 'ok' for record in week_records):>6} '
+            f'{_percentile(durations, 50):>8.1f} {_percentile(durations, 95):>8.1f} '
+            f'{requests / len(week_records):>8.1f} '
+            f'{_hit_rate(week_records, 'youtube_etag'):>7} {_hit_rate(week_records, 'churchtools_responses'):>8}'
+        )
+    return '\n'.join(lines)
+
+
+def _percentile(values: list[float], percent: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def _hit_rate(records: list[RunRecord], cache: str) -> str:
+    lookups = sum(record['caches'][cache]['lookups'] for record in records)
+    if not lookups:
+        return '-'
+    return f'{sum(record['caches'][cache]['hits'] for record in records) / lookups:.0%}'
@@ -0,0 +1,113 @@
+"""
+Write-ahead journal of operations that take multiple requests to complete
+
+Creating a broadcast (insert, bind, link) or a post (create, link) is not atomic. Each operation records its intent
+before the first request and every completed step afterward, so an operation interrupted by a crash is found again
+on the next run and resumed or rolled back (see :py:func:`update.recover_operations`) instead of being repeated.
+"""
+import json
+import logging
+import os
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Literal, Self
+
+import config
+
+log = logging.getLogger(__name__)
+
+type OperationKind = Literal['youtube', 'post']
+
+
+@dataclass(slots=True)
+class Operation:
+    """An operation recorded in the journal"""
+    id: str
+    kind: OperationKind
+    event_id: int
+    steps: dict[str, Any] = field(default_factory=dict)
+    """Completed steps with their results (e.g. ``created``: ID of the created object)"""
+
+
+class Journal:
+    """
+    Journal of one tenant, stored as JSON lines which are appended and synced to disk before proceeding.
+
+    Finished operations are dropped from the file when it is opened again.
+    """
+
+    path: Path
+    """The path of the journal file"""
+    pending: dict[str, Operation]
+    """Unfinished operations by ID"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.pending = {}
+        if path.exists():
+            for line in path.read_text().splitlines():
+                try:
+                    self._apply(json.loads(line))
+                except (ValueError, KeyError):
+                    # The last line may be incomplete if the process died while writing it
+                    log.warning('Ignoring malformed journal entry in %s: %r', path, line)
+        self._compact()
+        if self.pending:
+            log.warning('Found %s unfinished operation(s) in %s', len(self.pending), path)
+
+    @classmethod
+    def from_config(cls) -> Self:
+        """Open the journal configured in ``journal.filename``"""
+        return cls(config.temp_path(config.journal['filename']))
+
+    def begin(self, kind: OperationKind, event_id: int) -> Operation:
+        """Record the intent to start an operation for an event"""
+        op = Operation(id=uuid.uuid4().hex, kind=kind, event_id=event_id)
+        self._write({'op': op.id, 'kind': kind, 'event': event_id})
+        self.pending[op.id] = op
+        return op
+
+    def record(self, op: Operation, step: str, result: Any = None):
+        """Record that a step of the operation has been completed"""
+        self._write({'op': op.id, 'step': step, 'result': result})
+        op.steps[step] = result
+
+    def finish(self, op: Operation):
+        """Record that the operation has been completed (or rolled back)"""
+        self._write({'op': op.id, 'step': 'done'})
+        self.pending.pop(op.id, None)
+
+    def _apply(self, entry: dict[str, Any]):
+        """Replay an entry read from the journal file"""
+        op_id = entry['op']
+        if 'kind' in entry:
+            self.pending[op_id] = Operation(id=op_id, kind=entry['kind'], event_id=entry['event'])
+        elif entry['step'] == 'done':
+            self.pending.pop(op_id, None)
+        elif op_id in self.pending:
+            self.pending[op_id].steps[entry['step']] = entry['result']
+
+    def _entries(self, op: Operation) -> list[dict[str, Any]]:
+        """Entries recreating the given operation"""
+        return [{'op': op.id, 'kind': op.kind, 'event': op.event_id}] + [
+            {'op': op.id, 'step': step, 'result': result} for step, result in op.steps.items()
+        ]
+
+    def _compact(self):
+        """Rewrite the file with only the unfinished operations"""
+        tmp = self.path.with_name(f'{self.path.name}.tmp')
+        with tmp.open('w') as f:
+            for op in self.pending.values():
+                f.writelines(json.dumps(entry) + '\n' for entry in self._entries(op))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def _write(self, entry: dict[str, Any]):
+        """Append an entry and make sure it is on disk before the next step is taken"""
+        with self.path.open('a') as f:
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
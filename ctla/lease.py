@@ -0,0 +1,145 @@
+"""
+Expiring leases in a local SQLite database, to coordinate multiple workers processing the same tenants
+"""
+import contextlib
+import logging
+import os
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Optional, Self
+
+import config
+
+log = logging.getLogger(__name__)
+
+
+class LeaseLostError(RuntimeError):
+    """Raised when a lease expired and was taken over by another worker"""
+
+
+class LeaseStore:
+    """
+    Leases held by one worker (one run of a tenant).
+
+    A lease is identified by a key (e.g. ``tenant:<name>`` or ``event:<tenant>:<id>``) and held by at most one owner.
+    It expires after a while, so crashed workers do not block others forever.
+    """
+
+    path: Path
+    """Path of the database file"""
+    owner: str
+    """Unique identifier of this worker"""
+    duration: float
+    """Lifetime of acquired leases in seconds"""
+
+    def __init__(self, path: Path, duration: float):
+        self.path = path
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.duration = duration
+
+        with self._connect() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS leases ('
+                       'key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL, rerun INTEGER DEFAULT 0)')
+
+    @classmethod
+    def from_config(cls) -> Optional[Self]:
+        """Create a lease store from the ``locking`` configuration, or return ``None`` if locking is disabled"""
+        locking = config.locking
+        if not locking['enabled']:
+            return None
+        return cls(Path(tempfile.gettempdir()).joinpath(locking['database']), locking['lease_seconds'])
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a connection in autocommit mode, closed when leaving the context. Connections are not shared"""
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def acquire(self, key: str) -> bool:
+        """
+        Acquire or renew the lease for ``key``
+
+        :return: True if this worker holds the lease now
+        """
+        now = time.time()
+        with self._connect() as db:
+            db.execute('BEGIN IMMEDIATE')
+            db.execute(
+                'INSERT INTO leases (key, owner, expires) VALUES (?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET '
+                'rerun = CASE WHEN owner = excluded.owner THEN rerun ELSE 0 END, '
+                'owner = excluded.owner, expires = excluded.expires '
+                'WHERE owner = excluded.owner OR expires < ?',
+                (key, self.owner, now + self.duration, now)
+            )
+            owner, = db.execute('SELECT owner FROM leases WHERE key = ?', (key,)).fetchone()
+            db.execute('COMMIT')
+
+        if owner != self.owner:
+            log.debug('Lease "%s" is held by %s', key, owner)
+        return owner == self.owner
+
+    def ensure(self, key: str):
+        """
+        Renew the lease for ``key`` before writing
+
+        :raise LeaseLostError: if another worker holds the lease now
+        """
+        if not self.acquire(key):
+            raise LeaseLostError(f'Lease "{key}" expired and was taken over by another worker')
+
+    @contextlib.contextmanager
+    def keep_alive(self, key: str) -> Iterator[None]:
+        """
+        Renew the lease for ``key`` in the background while the body runs, every third of the lease's lifetime,
+        so that long phases (e.g. loading the events) do not let it expire
+        """
+        stopped = threading.Event()
+
+        def renew():
+            while not stopped.wait(self.duration / 3):
+                if not self.acquire(key):
+                    log.error('Lease "%s" was taken over by another worker.', key)
+                    return
+
+        thread = threading.Thread(target=renew, name=f'lease-{key}', daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stopped.set()
+            thread.join()
+
+    def release(self, key: str):
+        """Release the lease for ``key``, if held by this worker"""
+        with self._connect() as db:
+            db.execute('DELETE FROM leases WHERE key = ? AND owner = ?', (key, self.owner))
+
+    def release_all(self):
+        """Release all leases held by this worker"""
+        with self._connect() as db:
+            db.execute('DELETE FROM leases WHERE owner = ?', (self.owner,))
+
+    def request_rerun(self, key: str):
+        """Ask the current holder of the lease for ``key`` to run once more after finishing"""
+        with self._connect() as db:
+            db.execute('UPDATE leases SET rerun = 1 WHERE key = ?', (key,))
+
+    def take_rerun(self, key: str) -> bool:
+        """
+        Check and reset whether a rerun was requested for the lease ``key`` held by this worker
+
+        :return: True if a rerun was requested
+        """
+        with self._connect() as db:
+            return db.execute('UPDATE leases SET rerun = 0 WHERE key = ? AND owner = ? AND rerun = 1',
+                              (key, self.owner)).rowcount > 0
@@ -0,0 +1,134 @@
+"""
+Setup of the application's logging (``--log-level``, ``--log-json``, ``--log-sample``)
+
+Log calls should pass their arguments %-style instead of formatting them with f-strings, so that nothing is formatted
+for disabled levels. Arguments that are expensive to compute can be wrapped in :py:class:`Lazy`.
+
+Fields bound with :py:func:`bind` (e.g. the event being handled) are attached to all records logged in the same
+context, including the request pools, and are part of the JSON output.
+
+Chatty read-only statements (one per request or event) can opt into sampling with ``extra=SAMPLED``.
+Statements recording writes must never be sampled.
+"""
+import contextlib
+import contextvars
+import itertools
+import json
+import logging
+import sys
+from collections.abc import Callable, Iterator
+from types import MappingProxyType
+from typing import Any, Mapping
+
+SAMPLED: Mapping[str, Any] = MappingProxyType({'sampled': True})
+"""``extra`` of the log statements that are sampled with ``--log-sample``"""
+
+_context: contextvars.ContextVar[Mapping[str, Any]] = contextvars.ContextVar('log_context',
+                                                                              default=MappingProxyType({}))
+"""Fields bound in the current context"""
+
+
+class Lazy:
+    """
+    A log argument or field that is only computed when the record is actually emitted
+
+    ``log.debug('Events: %s', Lazy(pprint.pformat, events))``
+    """
+
+    __slots__ = ('_fn', '_args')
+
+    def __init__(self, fn: Callable[..., Any], *args):
+        self._fn = fn
+        self._args = args
+
+    def __call__(self) -> Any:
+        return self._fn(*self._args)
+
+    def __str__(self) -> str:
+        return str(self())
+
+
+@contextlib.contextmanager
+def bind(**fields) -> Iterator[None]:
+    """
+    Attach the fields to all records logged in the body (in the current context).
+    Values may be :py:class:`Lazy`, e.g. to log an ID that is only known later.
+    """
+    token = _context.set(MappingProxyType({**_context.get(), **fields}))
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Adds the bound fields to the records as ``record.context``"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.context = _context.get()
+        return True
+
+
+class SampleFilter(logging.Filter):
+    """
+    Passes only the first and then every ``rate``-th record of each call site logged with ``extra=SAMPLED``.
+    All other records, and warnings and errors, are never sampled.
+    """
+
+    rate: int
+    _counters: dict[tuple[str, int], Iterator[int]]
+
+    def __init__(self, rate: int):
+        super().__init__()
+        self.rate = rate
+        self._counters = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, 'sampled', False) or record.levelno >= logging.WARNING:
+            return True
+        counter = self._counters.get((record.pathname, record.lineno))
+        if counter is None:
+            counter = self._counters.setdefault((record.pathname, record.lineno), itertools.count())
+        if next(counter) % self.rate:
+            return False
+        record.sample_rate = self.rate
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats each record as a JSON object on a single line, including the bound fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage()
+        }
+        for name, value in getattr(record, 'context', {}).items():
+            data[name] = value() if isinstance(value, Lazy) else value
+        if hasattr(record, 'sample_rate'):
+            data['sample_rate'] = record.sample_rate
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+def setup(level: str = 'INFO', as_json: bool = False, sample_rate: int = 1):
+    """
+    Configure the root logger. May be called again to change the configuration
+
+    :param level: Name of the minimum level
+    :param as_json: Write JSON lines instead of plain text
+    :param sample_rate: Emit only every ``sample_rate``-th record of each statement logged with ``extra=SAMPLED``
+    """
+    handler = logging.StreamHandler(sys.stderr)
+    handler.addFilter(ContextFilter())
+    if sample_rate > 1:
+        handler.addFilter(SampleFilter(sample_rate))
+    if as_json:
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    logging.basicConfig(level=level, handlers=[handler], force=True)
@@ -0,0 +1,139 @@
+"""
+Reporting to the external monitor (``monitor_url``) in the background
+"""
+import logging
+import queue
+import threading
+import time
+from typing import Optional, Self
+
+import requests
+
+import cassette
+import config
+from data import RuntimeStats
+
+log = logging.getLogger(__name__)
+
+_queue: queue.SimpleQueue[tuple[str, float] | threading.Event] = queue.SimpleQueue()
+"""Reports (URL and timeout) waiting to be sent, or events to set once all previous reports were sent"""
+_sender: Optional[threading.Thread] = None
+_sender_lock = threading.Lock()
+_pending_ms = 0
+"""Sum of the timeouts of the reports queued or being sent in milliseconds (guarded by ``_sender_lock``)"""
+
+
+def _send_reports():
+    """Send the queued reports one after another. Runs in a daemon thread, so it never keeps the process alive"""
+    while True:
+        item = _queue.get()
+        if isinstance(item, threading.Event):
+            item.set()
+            continue
+        url, timeout = item
+        try:
+            requests.get(url, timeout=timeout)
+        except requests.RequestException as e:
+            log.warning('Could not report to monitor: %s', e)
+        finally:
+            _done_sending(timeout)
+
+
+def _done_sending(timeout: float):
+    global _pending_ms
+    with _sender_lock:
+        _pending_ms -= round(timeout * 1000)
+
+
+def _enqueue(item: tuple[str, float] | threading.Event):
+    global _sender, _pending_ms
+    with _sender_lock:
+        if _sender is None:
+            _sender = threading.Thread(target=_send_reports, name='monitor', daemon=True)
+            _sender.start()
+        if not isinstance(item, threading.Event):
+            _pending_ms += round(item[1] * 1000)
+        _queue.put(item)
+
+
+def flush() -> bool:
+    """
+    Wait for the queued reports (of all tenants) to be sent, e.g. before the process exits.
+
+    Waits at most as long as sending all of them may take: twice the sum of their timeouts,
+    as each timeout applies to connecting and to reading separately.
+
+    :return: True if all reports were sent in time
+    """
+    with _sender_lock:
+        budget = 2 * _pending_ms / 1000
+    if _sender is None or budget <= 0:
+        return True
+    done = threading.Event()
+    _enqueue(done)
+    return done.wait(budget)
+
+
+class RunReporter:
+    """
+    Reports a run of the active configuration to its monitor.
+
+    Used as context manager: while the run is going on, heartbeats with the current stage are sent
+    every ``monitor.heartbeat_seconds``.
+    All reports are sent in the background with a timeout of ``monitor.timeout``.
+    """
+
+    stats: RuntimeStats
+    _url: Optional[str]
+    _timeout: float
+    _heartbeat: float
+    _start_time: float
+    _stopped: threading.Event
+    _heartbeats: Optional[threading.Thread] = None
+
+    def __init__(self, stats: RuntimeStats):
+        # Capture the active configuration, as heartbeats are sent from another thread
+        self.stats = stats
+        self._url = config.monitor_url
+        self._timeout = config.monitor['timeout']
+        self._heartbeat = config.monitor['heartbeat_seconds']
+        self._start_time = time.time()
+        self._stopped = threading.Event()
+
+    def __enter__(self) -> Self:
+        if self._url and self._heartbeat > 0:
+            self._heartbeats = threading.Thread(target=self._send_heartbeats, name='monitor-heartbeat', daemon=True)
+            self._heartbeats.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stop_heartbeats()
+
+    def _send_heartbeats(self):
+        while not self._stopped.wait(self._heartbeat):
+            self._enqueue_report('up', f'Running{self.stats.stage}…')
+
+    def _stop_heartbeats(self):
+        """Stop sending heartbeats and wait until a heartbeat being queued is done"""
+        self._stopped.set()
+        if self._heartbeats:
+            self._heartbeats.join()
+
+    def report(self, status: str, msg: str):
+        """
+        Queue the final report of the run for the monitor, if configured.
+
+        Heartbeats are stopped first, so none of them can be queued after the final report.
+
+        :param status: ``up`` or ``down``
+        :param msg: The message
+        """
+        self._stop_heartbeats()
+        self._enqueue_report(status, msg)
+
+    def _enqueue_report(self, status: str, msg: str):
+        """Queue a report for the monitor, if configured"""
+        # Replays must not report for the recorded run
+        if self._url and not cassette.replaying():
+            ping = int((time.time() - self._start_time) * 1000)
+            _enqueue((self._url.format(status=status, msg=msg, ping=ping), self._timeout))
@@ -0,0 +1,142 @@
+"""
+Garbage collection of artifacts left behind by interrupted runs or changed events (``--gc``)
+
+Orphans are:
+
+- Broadcasts bound to the configured stream key that have not gone live yet, are not linked from any event within
+  ``gc.days_to_load`` days, and match the title and start of such an event (see :py:class:`setup.BroadcastIndex`)
+  that links to another broadcast or does not want a stream. Other broadcasts may have been scheduled by hand, so
+  they are never collected.
+- Post links whose post no longer exists
+"""
+import datetime
+import logging
+import time
+from dataclasses import dataclass, field
+
+import config
+from ct.ChurchTools import ChurchTools
+from ct.EventFile import EventFile
+from data import Event, parse_post_id, parse_video_id
+from setup import BroadcastIndex
+from yt.Broadcast import Broadcast
+from yt.YouTube import YouTube, QuotaExceededError
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class Orphans:
+    """Orphaned artifacts found by :py:func:`find`"""
+    broadcasts: list[Broadcast] = field(default_factory=list)
+    post_links: list[EventFile] = field(default_factory=list)
+
+    def __len__(self):
+        return len(self.broadcasts) + len(self.post_links)
+
+
+def find(ct: ChurchTools, yt: YouTube) -> Orphans:
+    """
+    Index all broadcasts bound to the stream key, all CTLA attachments of upcoming events and the posts they link to,
+    and return the artifacts that are not referenced and can be proven to be created by CTLA
+
+    :param ct: The ChurchTools API instance
+    :param yt: The YouTube service instance
+    :return: The orphans
+    """
+    days = config.gc['days_to_load']
+    horizon = datetime.datetime.now(datetime.UTC) + datetime.timedelta(days=days)
+    stream_link_name = config.churchtools['stream_attachment_name']
+    post_settings = config.churchtools.get('post_settings')
+    post_link_name = post_settings['attachment_name'] if post_settings else None
+
+    broadcasts = yt.get_upcoming_broadcasts_bound_to(config.youtube['stream_key_id'])
+    attachments = [file for files in ct.get_event_attachments(days).values() for file in files]
+
+    linked_videos = {parse_video_id(file.url) for file in attachments if file.name == stream_link_name}
+    index = BroadcastIndex(
+        bc for bc in broadcasts
+        # Events beyond the horizon were not loaded, so their broadcasts may still be referenced
+        if bc.id not in linked_videos and bc.scheduled_start and bc.scheduled_start <= horizon
+    )
+    bound_videos = {bc.id for bc in broadcasts}
+    created, needed = set(), set()
+    for event in ct.get_upcoming_events(days, Event):
+        candidates = {bc.id for bc in index.find(event)}
+        created |= candidates
+        # The next run re-links the broadcast of an event that wants a stream but has none
+        if event.wants_stream and event.youtube_video_id not in bound_videos:
+            needed |= candidates
+    orphans = Orphans(broadcasts=[bc for bc in broadcasts if bc.id in created - needed])
+
+    if post_link_name:
+        post_links = {}
+        for file in attachments:
+            if file.name != post_link_name:
+                continue
+            post_id = parse_post_id(file.url)
+            if post_id is None:
+                log.warning('Could not parse post id from link %s (%s), skipping it.', file.id, file.url)
+                continue
+            post_links[post_id] = file
+        found = ct.get_posts(post_settings['group_id'], set(post_links)) if post_links else {}
+        # Posts might have been moved to another group, so check the missing ones individually
+        orphans.post_links = [link for post_id, link in post_links.items()
+                              if post_id not in found and not ct.post_exists(post_id)]
+
+    return orphans
+
+
+def report(orphans: Orphans):
+    """Log the orphans found"""
+    for bc in orphans.broadcasts:
+        log.info('Orphaned broadcast %s "%s" (scheduled for %s)', bc.id, bc.title, bc.scheduled_start)
+    for link in orphans.post_links:
+        log.info('Orphaned post link %s (%s)', link.id, link.url)
+    log.info('Found %s orphaned broadcast(s) and %s orphaned post link(s).', len(orphans.broadcasts),
+             len(orphans.post_links))
+
+
+def delete(ct: ChurchTools, yt: YouTube, orphans: Orphans) -> int:
+    """
+    Delete the orphans in batches of ``gc.batch_size``, pausing ``gc.batch_delay`` seconds between the batches.
+
+    Stops early if the YouTube quota (``youtube.quota_per_run``) is used up.
+
+    :return: The number of deleted orphans
+    """
+    batch_size = max(1, config.gc['batch_size'])
+    # Links first, as deleting broadcasts may run out of quota
+    deletions = [(ct.delete_link, link.id) for link in orphans.post_links]
+    deletions += [(yt.delete_broadcast, bc.id) for bc in orphans.broadcasts]
+
+    deleted = 0
+    for i, (delete_orphan, orphan_id) in enumerate(deletions):
+        if i and i % batch_size == 0:
+            time.sleep(config.gc['batch_delay'])
+        try:
+            delete_orphan(orphan_id)
+        except QuotaExceededError as e:
+            log.warning('%s: leaving %s orphan(s) for the next collection.', e, len(deletions) - i)
+            break
+        deleted += 1
+
+    log.info('Deleted %s of %s orphan(s).', deleted, len(orphans))
+    return deleted
+
+
+def collect(ct: ChurchTools, yt: YouTube, dry_run: bool = False) -> Orphans:
+    """
+    Find, report and (unless ``dry_run``) delete orphans
+
+    :param ct: The ChurchTools API instance
+    :param yt: The YouTube service instance
+    :param dry_run: Only report the orphans
+    :return: The orphans found
+    """
+    yt.reset_quota()
+    orphans = find(ct, yt)
+    report(orphans)
+    if orphans and not dry_run:
+        delete(ct, yt, orphans)
+    return orphans
@@ -0,0 +1,213 @@
+"""
+Profiling of whole runs (``--profile``, ``--profile-mem``)
+
+CPU profiling combines two views:
+
+- ``cProfile`` (which covers all threads since Python 3.12), written as ``.pstats`` file
+  (e.g. for ``snakeviz`` or ``python -m pstats``)
+- A sampler recording the stacks of all threads (including the request pools) every few milliseconds,
+  written as collapsed stacks (``.collapsed``, e.g. for ``flamegraph.pl`` or speedscope)
+
+Memory profiling takes a ``tracemalloc`` snapshot before and after every phase of a run (see
+:py:meth:`data.RuntimeStats.phase`) and records the allocations that grew the most. As all tenants share the
+process, phases running concurrently for multiple tenants are not separated.
+"""
+import cProfile
+import contextlib
+import functools
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from types import CodeType, FrameType
+from typing import Optional
+
+log = logging.getLogger(__name__)
+
+SAMPLE_INTERVAL = 0.01
+"""Seconds between two samples of the stacks"""
+TOP_N = 15
+"""Number of entries in the printed summary"""
+
+
+@dataclass(slots=True)
+class PhaseMemory:
+    """Memory allocated during a phase"""
+    phase: str
+    peak: int
+    """Peak of traced memory during the phase in bytes"""
+    growth: int
+    """Traced memory at the end of the phase minus at its start in bytes"""
+    top: list[tracemalloc.StatisticDiff]
+    """Allocation sites that grew the most"""
+
+
+class Session:
+    """A profiling session covering everything run between :py:func:`start` and :py:func:`stop`"""
+
+    directory: Path
+    prefix: str
+    """Common prefix of the output files"""
+    cpu: bool
+    memory: bool
+    profile: Optional[cProfile.Profile] = None
+    samples: Counter[str]
+    """Number of samples per collapsed stack"""
+    phases: list[PhaseMemory]
+    _lock: threading.Lock
+    _stopped: threading.Event
+    _sampler: Optional[threading.Thread] = None
+
+    def __init__(self, directory: Path, cpu: bool, memory: bool):
+        self.directory = directory
+        self.prefix = f'ctla-profile-{datetime.now():%Y%m%d-%H%M%S}'
+        self.cpu = cpu
+        self.memory = memory
+        self.samples = Counter()
+        self.phases = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+        if cpu:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+            self._sampler = threading.Thread(target=self._sample, name='profile-sampler', daemon=True)
+            self._sampler.start()
+        if memory:
+            tracemalloc.start()
+
+    def _sample(self):
+        """Record the stacks of all other threads until stopped"""
+        own_id = threading.get_ident()
+        while not self._stopped.wait(SAMPLE_INTERVAL):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = [_collapse(names.get(thread_id, str(thread_id)), frame)
+                      for thread_id, frame in sys._current_frames().items() if thread_id != own_id]
+            with self._lock:
+                self.samples.update(stacks)
+
+    def add_phase(self, phase: PhaseMemory):
+        with self._lock:
+            self.phases.append(phase)
+
+    def finish(self):
+        """Stop collecting, write the output files and log a summary"""
+        self._stopped.set()
+        if self.profile:
+            self.profile.disable()
+        if self._sampler:
+            self._sampler.join()
+        if self.memory:
+            tracemalloc.stop()
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        if self.cpu:
+            self._write_cpu()
+        if self.memory:
+            self._write_memory()
+
+    def _write_cpu(self):
+        summary = io.StringIO()
+        path = self.directory / f'{self.prefix}.pstats'
+        stats = pstats.Stats(self.profile, stream=summary)
+        stats.dump_stats(path)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_N)
+        log.info('Wrote CPU profile to %s', path)
+
+        path = self.directory / f'{self.prefix}.collapsed'
+        path.write_text(''.join(f'{stack} {count}\n' for stack, count in self.samples.items()))
+        log.info('Wrote %s stack samples to %s', sum(self.samples.values()), path)
+
+        # Leaf frames of the samples, i.e. where the time was spent (including waiting for I/O)
+        leaves = Counter()
+        for stack, count in self.samples.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        summary.write(f'Top {TOP_N} sampled frames:\n')
+        summary.writelines(f'{count / total:7.1%}  {frame}\n' for frame, count in leaves.most_common(TOP_N))
+        log.info('CPU profile summary:\n%s', summary.getvalue())
+
+    def _write_memory(self):
+        report = io.StringIO()
+        for phase in self.phases:
+            report.write(f'Phase "{phase.phase}": peak {_mib(phase.peak)}, growth {_mib(phase.growth)}\n')
+            report.writelines(f'  {stat}\n' for stat in phase.top)
+        path = self.directory / f'{self.prefix}-memory.txt'
+        path.write_text(report.getvalue())
+        log.info('Wrote memory profile to %s', path)
+        log.info('Memory profile summary:\n' + ''.join(
+            f'{phase.phase:>12}: peak {_mib(phase.peak)}, growth {_mib(phase.growth)}, '
+            f'top: {phase.top[0].traceback if phase.top else "-"}\n'
+            for phase in self.phases
+        ))
+
+
+_session: Optional[Session] = None
+
+
+def start(directory: Path, cpu: bool, memory: bool):
+    """Start profiling all following runs"""
+    global _session
+    _session = Session(directory, cpu, memory)
+
+
+def stop():
+    """Stop profiling and write the results, if profiling was started"""
+    global _session
+    session, _session = _session, None
+    if session:
+        session.finish()
+
+
+@contextlib.contextmanager
+def memory_phase(name: str):
+    """Record the allocations of the body as phase ``name`` if memory profiling is enabled"""
+    session = _session
+    if session is None or not session.memory:
+        yield
+        return
+    before = _snapshot()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    try:
+        yield
+    finally:
+        after = _snapshot()
+        end, peak = tracemalloc.get_traced_memory()
+        top = after.compare_to(before, 'lineno')[:TOP_N]
+        session.add_phase(PhaseMemory(name, peak, end - current, top))
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    """Take a snapshot without the allocations of the profiling itself"""
+    return tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__)
+    ])
+
+
+def _collapse(thread_name: str, frame: Optional[FrameType]) -> str:
+    """Format a stack in the collapsed format, root first"""
+    frames = []
+    while frame is not None:
+        frames.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    frames.append(thread_name)
+    return ';'.join(reversed(frames))
+
+
+@functools.cache
+def _frame_name(code: CodeType) -> str:
+    """Name of a function in the collapsed stacks. Cached, as the sampler shows up in the CPU profile"""
+    return f'{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+def _mib(size: int) -> str:
+    return f'{size / 1024 / 1024:.1f} MiB'
@@ -0,0 +1,183 @@
+"""
+On-disk cache of API responses that rarely change, shared between runs and processes
+"""
+import contextlib
+import fnmatch
+import json
+import logging
+import re
+import sqlite3
+import time
+import urllib.parse
+from collections.abc import Iterator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Optional, Self
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+import config
+from configs.response_cache import ResponseCacheConf
+
+log = logging.getLogger(__name__)
+
+_MAX_AGE = re.compile(r'max-age=(\d+)')
+_STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+"""Response headers kept in the cache"""
+
+
+@dataclass(slots=True)
+class CachedResponse:
+    """A response read from the cache"""
+    headers: dict[str, str]
+    body: bytes
+    expires: float
+    """Timestamp after which the response has to be revalidated"""
+
+    @property
+    def fresh(self) -> bool:
+        return self.expires > time.time()
+
+    @property
+    def validators(self) -> dict[str, str]:
+        """Headers for a conditional request revalidating this response"""
+        headers = {}
+        if 'ETag' in self.headers:
+            headers['If-None-Match'] = self.headers['ETag']
+        if 'Last-Modified' in self.headers:
+            headers['If-Modified-Since'] = self.headers['Last-Modified']
+        return headers
+
+    def to_response(self, url: str) -> requests.Response:
+        """Recreate the ``requests``-library's Response-object"""
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.headers = CaseInsensitiveDict(self.headers)
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response._content = self.body
+        return response
+
+
+class ResponseCache:
+    """
+    Responses to GET requests in a SQLite database, keyed by path and query.
+
+    The database can be used by multiple processes at once. Connections are not shared between threads.
+    """
+
+    path: Path
+    """Path of the database file"""
+    ttl: dict[str, int]
+    """Time to live in seconds by path pattern"""
+    max_bytes: int
+    """Size of all response bodies above which the least recently used responses are evicted"""
+
+    def __init__(self, path: Path, ttl: dict[str, int], max_bytes: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+        with self._connect() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS responses ('
+                       'key TEXT PRIMARY KEY, path TEXT NOT NULL, headers TEXT NOT NULL, body BLOB NOT NULL, '
+                       'expires REAL NOT NULL, accessed REAL NOT NULL)')
+
+    @classmethod
+    def from_config(cls, conf: ResponseCacheConf) -> Optional[Self]:
+        """Create the cache from its configuration, or return ``None`` if it is disabled"""
+        if not conf['enabled']:
+            return None
+        return cls(config.temp_path(conf['filename']), conf['ttl'], int(conf['max_megabytes'] * 1024 * 1024))
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a connection in autocommit mode, closed when leaving the context"""
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def ttl_for(self, path: str) -> int:
+        """Return the time to live of responses for the API path, ``0`` if they must not be cached"""
+        return next((ttl for pattern, ttl in self.ttl.items() if fnmatch.fnmatchcase(path, pattern)), 0)
+
+    @staticmethod
+    def key(path: str, params: dict[str, Any]) -> str:
+        """The cache key of a request"""
+        return f'{path}?{urllib.parse.urlencode(sorted(params.items()), doseq=True)}'
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """Return the cached response (fresh or expired) for the key"""
+        with self._connect() as db:
+            row = db.execute('SELECT headers, body, expires FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            db.execute('UPDATE responses SET accessed = ? WHERE key = ?', (time.time(), key))
+        headers, body, expires = row
+        return CachedResponse(json.loads(headers), body, expires)
+
+    def store(self, key: str, path: str, response: requests.Response, ttl: int):
+        """
+        Store a successful response, unless it forbids it (``Cache-Control: no-store``)
+
+        :param key: The cache key of the request
+        :param path: The API path of the request
+        :param response: The response to store
+        :param ttl: The time to live configured for the path
+        """
+        lifetime = _lifetime(response, ttl)
+        headers = {name: response.headers[name] for name in _STORED_HEADERS if name in response.headers}
+        if lifetime is None or (lifetime == 0 and not CachedResponse(headers, b'', 0).validators):
+            return
+
+        now = time.time()
+        with self._connect() as db:
+            db.execute('INSERT OR REPLACE INTO responses (key, path, headers, body, expires, accessed) '
+                       'VALUES (?, ?, ?, ?, ?, ?)',
+                       (key, path, json.dumps(headers), response.content, now + lifetime, now))
+            self._evict(db)
+
+    def revalidated(self, key: str, response: requests.Response, ttl: int):
+        """Extend the lifetime of a cached response after the server confirmed it is unchanged (304)"""
+        lifetime = _lifetime(response, ttl)
+        with self._connect() as db:
+            if lifetime is None:
+                db.execute('DELETE FROM responses WHERE key = ?', (key,))
+            else:
+                db.execute('UPDATE responses SET expires = ? WHERE key = ?', (time.time() + lifetime, key))
+
+    def invalidate(self, pattern: str):
+        """Drop all cached responses for paths matching the pattern (``GLOB`` syntax), after they were changed"""
+        with self._connect() as db:
+            deleted = db.execute('DELETE FROM responses WHERE path GLOB ?', (pattern,)).rowcount
+        if deleted:
+            log.debug('Invalidated %d cached response(s) for %s', deleted, pattern)
+
+    def _evict(self, db: sqlite3.Connection):
+        """Delete the least recently used responses until the cache fits into :py:attr:`max_bytes`"""
+        total, = db.execute('SELECT COALESCE(SUM(LENGTH(body)), 0) FROM responses').fetchone()
+        if total <= self.max_bytes:
+            return
+        for key, size in db.execute('SELECT key, LENGTH(body) FROM responses ORDER BY accessed').fetchall():
+            if total <= self.max_bytes:
+                break
+            db.execute('DELETE FROM responses WHERE key = ?', (key,))
+            total -= size
+
+
+def _lifetime(response: requests.Response, ttl: int) -> Optional[int]:
+    """
+    The number of seconds the response may be reused, according to the configured TTL and its ``Cache-Control``
+
+    :return: The lifetime, or ``None`` if the response must not be stored
+    """
+    cache_control = response.headers.get('Cache-Control', '').lower()
+    if 'no-store' in cache_control:
+        return None
+    if 'no-cache' in cache_control:
+        return 0
+    max_age = _MAX_AGE.search(cache_control)
+    return min(ttl, int(max_age[1])) if max_age else ttl
@@ -2,48 +2,132 @@
 Functions used solely to gather information
 """
 import logging
-from collections.abc import Generator
+from collections.abc import Iterable
+from datetime import datetime, UTC
 
 import config
+import logs
 from ct.ChurchTools import ChurchTools
 from ct.Facts import ManageStreamBehavior
 from data import Event, RuntimeStats
+from yt.Broadcast import Broadcast
 from yt.YouTube import YouTube
-from yt.type_hints import LiveBroadcast
 
 log = logging.getLogger(__name__)
 
 
-def gather_event_info(ct: ChurchTools, yt: YouTube, stats: RuntimeStats = None) -> Generator[Event]:
+def gather_events(ct: ChurchTools, stats: RuntimeStats = None) -> list[Event]:
     """
-    Fetch and return all events to act upon.
-
-    This also searches for matching YouTube broadcasts and attaches them, if found.
+    Fetch and return all events to act upon from ChurchTools
 
     :param ct: The ChurchTools API Instance
-    :param yt: The YouTube service instance
     :param stats: Optional stats object to record number of skipped events
     :return: A list of events
     """
-    ct_events = ct.get_upcoming_events(config.churchtools['days_to_load'])
-    yt_broadcasts = yt.get_active_and_upcoming_broadcasts()
-
-    for ct_evt in ct_events:
-        event = Event(**vars(ct_evt))
-
+    events = []
+    for event in ct.get_upcoming_events(config.churchtools['days_to_load'], Event):
         if event.facts.behavior == ManageStreamBehavior.IGNORE:
             log.info(f'Skipping event {event}, as it is ignored.')
             if stats:
                 stats.skipped += 1
             continue
+        events.append(event)
+    return events
+
+
+def attach_youtube_broadcasts(events: list[Event], yt: YouTube):
+    """
+    Search for matching YouTube broadcasts and attach them to the events, if found.
+
+    Events wanting a stream whose link is missing or broken are matched to unlinked broadcasts by title and start
+    (see :py:class:`BroadcastIndex`), so their broadcast is re-linked instead of created again.
 
+    :param events: The events from :py:func:`gather_events`
+    :param yt: The YouTube service instance
+    """
+    yt_broadcasts = yt.get_active_and_upcoming_broadcasts()
+    linked_ids = {event.youtube_video_id for event in events}
+    index = BroadcastIndex(bc for bc in yt_broadcasts if bc.id not in linked_ids)
+
+    unlinked = []
+    for event in events:
         if attach_youtube_broadcast(event, yt, yt_broadcasts):
-            log.debug(f'Attached YouTube broadcast to {event}')
+            log.debug('Attached YouTube broadcast to %s', event, extra=logs.SAMPLED)
+        elif event.wants_stream:
+            unlinked.append(event)
 
-        yield event
+    for event, bc in index.match(unlinked):
+        log.info('Found unlinked broadcast %s matching %s, it will be re-linked.', bc.id, event)
+        event.yt_broadcast = bc
 
 
-def attach_youtube_broadcast(event: Event, yt: YouTube, broadcasts: list[LiveBroadcast]) -> bool:
+class BroadcastIndex:
+    """
+    Index of broadcasts by normalized title and scheduled start, to find the broadcast of an event without its link
+
+    Events are looked up by their YouTube title and by their plain title, as earlier versions created broadcasts with
+    the plain title and only renamed them after linking them.
+    """
+
+    _broadcasts: dict[tuple[str, datetime], list[Broadcast]]
+
+    def __init__(self, broadcasts: Iterable[Broadcast]):
+        self._broadcasts = {}
+        for bc in broadcasts:
+            if bc.scheduled_start:
+                self._broadcasts.setdefault(_index_key(bc.title, bc.scheduled_start), []).append(bc)
+
+    def match(self, events: list[Event]) -> list[tuple[Event, Broadcast]]:
+        """
+        Find the broadcasts of the events.
+
+        If multiple events match the same title and start, none of them is matched, as it cannot be told which event
+        the broadcast belongs to.
+
+        :param events: Events without a linked broadcast
+        :return: The events with a unique match, and their broadcast
+        """
+        claimants: dict[tuple[str, datetime], list[Event]] = {}
+        for event in events:
+            for key in _event_keys(event):
+                if key in self._broadcasts:
+                    claimants.setdefault(key, []).append(event)
+
+        conflicted: set[int] = set()
+        for key, claiming in claimants.items():
+            if len(claiming) > 1:
+                log.warning('Conflict: %s all match the same broadcast title and start. Not re-linking any of them.',
+                            ', '.join(map(str, claiming)))
+                conflicted.update(event.id for event in claiming)
+
+        matches = []
+        for event in events:
+            candidates = self.find(event)
+            if not candidates or event.id in conflicted:
+                continue
+            if len(candidates) > 1:
+                log.warning('Duplicate broadcasts for %s: %s. Re-linking %s, the others can be removed with --gc.',
+                            event, ', '.join(bc.id for bc in candidates), candidates[0].id)
+            matches.append((event, candidates[0]))
+        return matches
+
+    def find(self, event: Event) -> list[Broadcast]:
+        """All broadcasts whose title and start match the event, the ones with its YouTube title first"""
+        return [bc for key in _event_keys(event) for bc in self._broadcasts.get(key, [])]
+
+
+def _event_keys(event: Event) -> list[tuple[str, datetime]]:
+    """The index keys an event's broadcast may have, the one of its YouTube title first"""
+    keys = [_index_key(event.yt_title, event.start_time), _index_key(event.title, event.start_time)]
+    return keys[:1] if keys[0] == keys[1] else keys
+
+
+def _index_key(title: str, start: datetime) -> tuple[str, datetime]:
+    """Normalize title (case and whitespace) and start time (UTC, whole minutes) for lookups"""
+    return ' '.join(title.casefold().split()), start.astimezone(UTC).replace(second=0, microsecond=0)
+
+
+def attach_youtube_broadcast(event: Event, yt: YouTube, broadcasts: list[Broadcast]) -> bool:
     """
     Try to find a matching broadcast in the given list of available broadcasts
 
@@ -59,7 +143,7 @@ def attach_youtube_broadcast(event: Event, yt: YouTube, broadcasts: list[LiveBro
 
     # Try to find the broadcast in upcoming and active broadcasts
     for bc in broadcasts:
-        if bc['id'] == vid_id:
+        if bc.id == vid_id:
             event.yt_broadcast = bc
             return True
 
@@ -0,0 +1,244 @@
+"""
+A single synchronisation run for the active configuration
+"""
+import contextlib
+import datetime
+import logging
+import pprint
+from typing import Optional
+
+import config
+import delete
+import journal
+import lease
+import logs
+import setup
+import update
+import utils
+from breaker import UPSTREAM_ERRORS, CircuitOpenError
+from ct.ChurchTools import ChurchTools
+from data import RuntimeStats, Event
+from wp.WordPress import WordPress
+from yt.YouTube import YouTube, QuotaExceededError, WRITE_COST
+
+log = logging.getLogger(__name__)
+
+EVENT_QUOTA = 4 * WRITE_COST
+"""Quota units handling a single event may use at most (create, bind, update and set thumbnail)"""
+
+
+def run(ct: ChurchTools, yt: YouTube, wp: Optional[WordPress], stats: RuntimeStats,
+        leases: Optional[lease.LeaseStore] = None):
+    """
+    Synchronise events from ChurchTools to YouTube, posts and WordPress
+
+    :param ct: The ChurchTools API instance
+    :param yt: The YouTube service instance
+    :param wp: The WordPress API instance, if enabled
+    :param stats: Stats object to record the results in. ``stats.stage`` describes the current stage for error reports
+    :param leases: The leases of this worker, if locking is enabled.
+        Events leased by another worker are skipped, and the tenant's lease is renewed in the background while
+        processing. The run fails with :py:class:`lease.LeaseLostError` if another worker took over the tenant.
+    """
+    yt.reset_quota()
+    counters_before = _api_counters(ct, yt, wp)
+    ct_lookups_before, ct_cached_before = ct.cache_lookups, ct.cache_hits
+    try:
+        with leases.keep_alive(_tenant_key()) if leases else contextlib.nullcontext():
+            _run(ct, yt, wp, stats, leases)
+    finally:
+        for upstream, (requests_sent, bytes_received, seconds) in _api_counters(ct, yt, wp).items():
+            stats.requests_sent[upstream] = requests_sent - counters_before[upstream][0]
+            stats.bytes_received[upstream] = bytes_received - counters_before[upstream][1]
+            stats.request_seconds[upstream] = seconds - counters_before[upstream][2]
+        stats.ct_cache_lookups = ct.cache_lookups - ct_lookups_before
+        stats.ct_cached = ct.cache_hits - ct_cached_before
+        stats.yt_quota_used = yt.quota_used
+        log.info('Sent %s.', logs.Lazy(_format_traffic, stats))
+
+
+def _run(ct: ChurchTools, yt: YouTube, wp: Optional[WordPress], stats: RuntimeStats,
+         leases: Optional[lease.LeaseStore]):
+    """
+    Implementation of :py:func:`run`, recording the duration of each phase.
+
+    Only failures of ChurchTools while loading the events abort the run. If another upstream fails, the stages
+    depending on it are skipped (recorded in ``stats.degraded``) and the other stages still run.
+    """
+    with stats.phase('gather'):
+        events = setup.gather_events(ct, stats)
+        stats.total = len(events)
+        try:
+            yt.refresh_token_ahead()
+            setup.attach_youtube_broadcasts(events, yt)
+            youtube_available = True
+        except UPSTREAM_ERRORS as e:
+            # Without the broadcasts, handling events could create duplicates
+            _degrade(stats, 'youtube', e)
+            youtube_available = False
+        stats.yt_conditional, stats.yt_not_modified = yt.etag_requests, yt.etag_hits
+        yt.save_etag_cache()
+
+    ops = journal.Journal.from_config()
+    if youtube_available and ops.pending:
+        with stats.phase('recover'):
+            if leases:
+                leases.ensure(_tenant_key())
+            update.recover_operations(ct, yt, ops, events,
+                                      (lambda event_id: _lease_event(leases, event_id)) if leases else None)
+
+    log.debug('Events: %s', logs.Lazy(pprint.pformat, events))
+
+    deadline = utils.run_deadline.get()
+    reserve = config.timeouts['reserve_seconds']
+    priority_end = datetime.datetime.now(datetime.UTC) + datetime.timedelta(days=config.timeouts['priority_days'])
+
+    posts = None
+    if youtube_available and not deadline.expired(reserve):
+        with stats.phase('posts'):
+            try:
+                posts = update.fetch_posts(ct, [ev for ev in events if ev.wants_stream and ev.facts.create_post])
+            except UPSTREAM_ERRORS as e:
+                _degrade(stats, 'posts', e)
+
+    with stats.phase('events'):
+        for i, event in enumerate(events if youtube_available else []):
+            stats.stage = f' during handling of event "{event.title}" ({event.id})'
+            if deadline.expired():
+                log.warning('Run deadline reached: deferring %s event(s) to the next run.', len(events) - i)
+                stats.skipped += len(events) - i
+                break
+            low_priority = deadline.expired(reserve)
+            if low_priority and event.start_time > priority_end:
+                log.info('Run deadline is near: deferring event %s to the next run.', event.id)
+                stats.skipped += 1
+                continue
+            with logs.bind(event_id=event.id, broadcast_id=logs.Lazy(_broadcast_id, event)):
+                try:
+                    if not yt.has_quota(EVENT_QUOTA):
+                        raise QuotaExceededError(f'Less than {EVENT_QUOTA} YouTube quota units left')
+                    if leases and not _lease_event(leases, event.id):
+                        log.info('Event %s is being handled by another worker, skipping it.', event.id)
+                        stats.skipped += 1
+                        continue
+                    _sync_event(ct, yt, ops, event, None if low_priority else posts, stats)
+                except (QuotaExceededError, CircuitOpenError) as e:
+                    log.warning('%s: deferring %s event(s) to the next run.', e, len(events) - i)
+                    stats.skipped += len(events) - i
+                    if isinstance(e, CircuitOpenError):
+                        _degrade(stats, 'events', e)
+                    break
+                except UPSTREAM_ERRORS as e:
+                    _degrade(stats, 'events', e)
+                    stats.skipped += 1
+
+    # WordPress
+    if wp and deadline.expired(reserve):
+        log.warning('Run deadline is near: deferring the update of WordPress to the next run.')
+    elif wp:
+        stats.stage = ' during update of WordPress'
+        with stats.phase('wordpress'):
+            if leases:
+                leases.ensure(_tenant_key())
+            try:
+                update.update_wordpress(wp, [ev for ev in events if ev.yt_link and ev.facts.on_homepage])
+            except UPSTREAM_ERRORS as e:
+                _degrade(stats, 'wordpress', e)
+
+    stats.stage = ''
+
+
+def _degrade(stats: RuntimeStats, stage: str, error: Exception):
+    """Record that a stage could not be completed because of an upstream error"""
+    log.error('Upstream error%s, continuing without %s: %s', stats.stage, stage, error)
+    if stage not in stats.degraded:
+        stats.degraded.append(stage)
+
+
+def _api_counters(ct: ChurchTools, yt: YouTube, wp: Optional[WordPress]) -> dict[str, tuple[int, int, float]]:
+    """Total number of requests sent, response bytes received and seconds waited for responses by each client"""
+    return {
+        'churchtools': (ct.requests_sent, ct.bytes_received, ct.request_seconds),
+        'youtube': (yt.requests_sent, yt.bytes_received, yt.request_seconds),
+        'wordpress': (wp.requests_sent, wp.bytes_received, wp.request_seconds) if wp else (0, 0, 0.0)
+    }
+
+
+def _format_traffic(stats: RuntimeStats) -> str:
+    """Describe the requests sent to and the bytes received from each upstream"""
+    return ', '.join(f'{stats.requests_sent[upstream]} requests to {upstream} '
+                     f'({stats.bytes_received[upstream]} bytes received)' for upstream in stats.requests_sent)
+
+
+def _broadcast_id(event: Event) -> Optional[str]:
+    """ID of the event's broadcast for the log context, which changes when a broadcast is created"""
+    return event.yt_broadcast.id if event.yt_broadcast else event.youtube_video_id
+
+
+def _tenant_key() -> str:
+    """Key of the lease of the active tenant"""
+    return f'tenant:{config.active().name or 'default'}'
+
+
+def _lease_event(leases: lease.LeaseStore, event_id: int) -> bool:
+    """Renew the lease of the active tenant and acquire the lease for an event"""
+    tenant = config.active().name or 'default'
+    return leases.acquire(_tenant_key()) and leases.acquire(f'event:{tenant}:{event_id}')
+
+
+def _sync_event(ct: ChurchTools, yt: YouTube, ops: journal.Journal, event: Event, posts: Optional[dict[int, dict]],
+                stats: RuntimeStats):
+    """
+    Create, update or delete the broadcast and post of a single event
+
+    :param ops: The journal of the active tenant
+    :param posts: The fetched posts, or ``None`` to defer handling the event's post
+    """
+    if event.wants_stream:
+        change = False
+
+        if not event.yt_broadcast:
+            if event.yt_link:
+                # Link is present, but Stream isn't: Delete the old link
+                ct.delete_link(event.yt_link.id)
+
+            update.create_youtube(ct, yt, event, ops)
+            stats.new += 1
+        elif event.youtube_video_id != event.yt_broadcast.id:
+            # Broadcast was recovered by title and start time
+            update.relink_youtube(ct, event)
+            stats.relinked += 1
+
+        change |= update.update_youtube(yt, event)
+
+        if posts is not None:
+            if event.facts.create_post:
+                if not event.post_link:
+                    update.create_post(ct, event, ops)
+                    change |= True
+                else:
+                    change |= update.update_post(ct, event, posts.get(event.post_id))
+            else:
+                change |= delete.delete_post(ct, event)
+
+        if change:
+            stats.updated += 1
+
+    else:
+        if not event.yt_broadcast or event.yt_broadcast.life_cycle_status in {'created', 'ready'}:
+            # Only delete Broadcast if it hasn't happened yet
+            delete.delete_stream(ct, yt, event)
+            stats.deleted += 1
+        if posts is not None:
+            delete.delete_post(ct, event)
+
+
+def monitor_message(stats: RuntimeStats) -> str:
+    """Format the stats of a successful run for the external monitor"""
+    status = f'DEGRADED ({', '.join(stats.degraded)})' if stats.degraded else 'OK'
+    return (f'{status}: '
+            f'change:{stats.updated} (new:{stats.new}),del:{stats.deleted} | '
+            f'total:{stats.total} (skip:{stats.skipped}) | '
+            f'yt-unchanged:{stats.yt_not_modified}/{stats.yt_conditional} | '
+            f'time:{','.join(f'{phase}={duration:.1f}s' for phase, duration in stats.phases.items())} | '
+            f'api:{','.join(f'{upstream}={n}' for upstream, n in stats.requests_sent.items() if n)}')
@@ -0,0 +1,187 @@
+"""
+Run the synchronisation or garbage collection for one or many tenants (ChurchTools instances and channels)
+"""
+import contextvars
+import datetime
+import logging
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import config
+import history
+import lease
+import logs
+import monitor
+import orphans
+import sync
+import utils
+from ct.ChurchTools import ChurchTools
+from data import RuntimeStats
+from wp.WordPress import WordPress
+from yt.YouTube import YouTube
+
+log = logging.getLogger(__name__)
+
+
+class Tenant:
+    """
+    A tenant with its configuration and its own API clients.
+
+    The clients (and their caches) are kept across runs when running as daemon.
+    """
+
+    config: config.TenantConfig
+    ct: Optional[ChurchTools] = None
+    yt: Optional[YouTube] = None
+    wp: Optional[WordPress] = None
+
+    def __init__(self, tenant_config: config.TenantConfig):
+        self.config = tenant_config
+
+    @property
+    def name(self) -> str:
+        return self.config.name or 'default'
+
+    def run(self) -> bool:
+        """
+        Run the synchronisation for this tenant and report the result to its monitor.
+
+        With locking enabled, the tenant is skipped if another worker is already running it.
+        That worker is asked to run once more afterwards instead, so overlapping triggers are coalesced.
+
+        Must be called in a context where the tenant's configuration is active.
+
+        :return: True if the run was successful (or was handed over to another worker)
+        """
+        leases = lease.LeaseStore.from_config()
+        if leases is None:
+            return self._run_once(None)
+
+        key = f'tenant:{self.name}'
+        if not leases.acquire(key):
+            leases.request_rerun(key)
+            # The other worker may have finished in the meantime, before seeing the request
+            if not leases.acquire(key):
+                log.info('Tenant "%s" is being run by another worker, requested a rerun instead.', self.name)
+                return True
+        try:
+            success = self._run_once(leases)
+            while success and leases.take_rerun(key):
+                log.info('Rerun requested for tenant "%s".', self.name)
+                success = self._run_once(leases)
+            return success
+        finally:
+            leases.release_all()
+
+    def collect_garbage(self, dry_run: bool = False) -> bool:
+        """
+        Find and delete orphaned broadcasts and links of this tenant (see :py:mod:`orphans`).
+
+        With locking enabled, nothing is done while another worker is running the tenant.
+        Must be called in a context where the tenant's configuration is active.
+
+        :param dry_run: Only report the orphans
+        :return: True if the collection was successful
+        """
+        leases = lease.LeaseStore.from_config()
+        if leases and not leases.acquire(f'tenant:{self.name}'):
+            log.error('Tenant "%s" is being run by another worker, skipping garbage collection.', self.name)
+            return False
+        try:
+            self._create_clients()
+            orphans.collect(self.ct, self.yt, dry_run)
+        except (Exception, SystemExit):
+            log.exception('Garbage collection for tenant "%s" failed.', self.name)
+            return False
+        finally:
+            if leases:
+                leases.release_all()
+        return True
+
+    def _create_clients(self):
+        """Create the API clients that do not exist yet"""
+        if self.ct is None:
+            self.ct = ChurchTools()
+        if self.yt is None:
+            self.yt = YouTube()
+        if self.wp is None and config.wordpress['enabled']:
+            self.wp = WordPress()
+
+    def _run_once(self, leases: Optional[lease.LeaseStore]) -> bool:
+        """Run one synchronisation for this tenant, report the result to its monitor and record it in the history"""
+        stats = RuntimeStats()
+        started, start = datetime.datetime.now(datetime.UTC), time.monotonic()
+        status = 'failed'
+        log.info('Starting run for tenant "%s"…', self.name)
+        try:
+            with monitor.RunReporter(stats) as reporter:
+                try:
+                    self._create_clients()
+                    sync.run(self.ct, self.yt, self.wp, stats, leases)
+                except (Exception, SystemExit):
+                    log.exception('Run for tenant "%s" failed%s.', self.name, stats.stage)
+                    reporter.report('down', f'Something went wrong{stats.stage}.')
+                    return False
+
+                if stats.degraded:
+                    status = 'degraded'
+                    log.warning('Finished run for tenant "%s" without %s.', self.name, ', '.join(stats.degraded))
+                    reporter.report('down', sync.monitor_message(stats))
+                    return False
+
+                status = 'ok'
+                log.info('Finished run for tenant "%s".', self.name)
+                reporter.report('up', sync.monitor_message(stats))
+                return True
+        finally:
+            try:
+                history.append(history.build_record(self.name, stats, status, started, time.monotonic() - start))
+            except OSError:
+                log.exception('Could not record the run for tenant "%s" in the history.', self.name)
+
+
+def _run_tenant(tenant: Tenant, action: Callable[[Tenant], bool], deadline: utils.Deadline) -> bool:
+    """Activate the tenant's configuration and run the action for it. Meant to be called in a fresh context"""
+    config.activate(tenant.config)
+    utils.run_deadline.set(deadline)
+    with logs.bind(tenant=tenant.name):
+        return action(tenant)
+
+
+def run_all(tenants: list[Tenant], workers: int, action: Callable[[Tenant], bool] = Tenant.run) -> bool:
+    """
+    Run all tenants once, sharing a pool of ``workers`` threads
+
+    :param tenants: The tenants to run
+    :param workers: Number of tenants to run concurrently
+    :param action: What to run for each tenant, defaults to the synchronisation
+    :return: True if all runs were successful
+    """
+    # All tenants share the deadline, as it limits the duration of the whole run
+    deadline = utils.Deadline(config.timeouts['run_seconds'])
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tenant') as executor:
+        futures = [executor.submit(contextvars.Context().run, _run_tenant, tenant, action, deadline)
+                   for tenant in tenants]
+        return all([future.result() for future in futures])
+
+
+def serve(tenants: list[Tenant], workers: int, interval: Optional[float] = None) -> bool:
+    """
+    Run all tenants, either once or repeatedly
+
+    :param tenants: The tenants to run
+    :param workers: Number of tenants to run concurrently
+    :param interval: If set, run as daemon and start a new run for all tenants every ``interval`` seconds
+    :return: True if all runs (of the last cycle) were successful
+    """
+    while True:
+        cycle_start = time.monotonic()
+        success = run_all(tenants, workers)
+        if interval is None:
+            return success
+
+        delay = max(0.0, interval - (time.monotonic() - cycle_start))
+        log.info('Next run in %.0fs.', delay)
+        time.sleep(delay)
@@ -3,66 +3,79 @@ Update functions: create & update events, broadcasts, stuff
 """
 import atexit
 import datetime
+import hashlib
+import json
 import logging
 import operator
-import tempfile
+import threading
 import urllib.parse
-from collections.abc import MutableMapping
+from collections.abc import Callable, MutableMapping
 from datetime import timedelta
 from pathlib import Path
 from string import Template
-from typing import ClassVar
+from typing import ClassVar, Optional, TypedDict
 
 import config
+import utils
+from breaker import UPSTREAM_ERRORS
 from ct.ChurchTools import ChurchTools
-from data import Event
+from data import Event, parse_post_id
+from journal import Journal, Operation
 from wp import WordPressPage
 from wp.WordPress import WordPress
+from yt.Broadcast import Broadcast
 from yt.YouTube import YouTube
-from yt.type_hints import LiveBroadcast
 
 log = logging.getLogger(__name__)
 
 
 class ThumbnailCache(MutableMapping):
-    """Singleton class managing the caching of thumbnail information to avoid hitting YouTube API ratelimits"""
+    """
+    Class managing the caching of thumbnail information to avoid hitting YouTube API ratelimits
+
+    There is one instance per configured cache file (i.e. per tenant)
+    """
 
-    _instance: ClassVar['ThumbnailCache']
-    """Singleton instance"""
+    _instances: ClassVar[dict[Path, 'ThumbnailCache']] = {}
+    """Instances by cache file"""
+    _instances_lock: ClassVar[threading.Lock] = threading.Lock()
 
-    _cache_dict: dict[str, str] = {}
+    _thumbs_filename: Path
+    """The path of the thumbnail cache"""
+    _cache_dict: dict[str, str]
     """Thumbnail cache: YouTube ID -> Thumbnail URI"""
-    _accessed_keys: set[str] = set()
+    _accessed_keys: set[str]
     """
     Stores keys that have been accessed during the lifetime of this cache.
     Only those keys will be written back when saving
     """
 
     def __new__(cls):
-        """Implement the singleton pattern"""
-        if not hasattr(cls, '_instance'):
-            cls._instance = super(ThumbnailCache, cls).__new__(cls)
-            # Load the cache
-            if cls._instance._thumbs_filename.exists():
-                cls._instance._cache_dict = dict(
-                    line.split('|', maxsplit=1)
-                    for line in cls._instance._thumbs_filename.read_text().splitlines()
-                    if line
-                )
-            log.info(f'Loaded cached thumbnail information for {len(cls._instance._cache_dict)} broadcasts')
-            # Setup saving
-            atexit.register(cls._instance._save_cache)
-        return cls._instance
+        """Return the instance for the configured cache file"""
+        filename = config.temp_path(config.youtube['thumbnail_cache'])
+        with cls._instances_lock:
+            if filename not in cls._instances:
+                instance = super(ThumbnailCache, cls).__new__(cls)
+                instance._thumbs_filename = filename
+                instance._cache_dict = {}
+                instance._accessed_keys = set()
+                # Load the cache
+                if filename.exists():
+                    instance._cache_dict = dict(
+                        line.split('|', maxsplit=1)
+                        for line in filename.read_text().splitlines()
+                        if line
+                    )
+                log.info('Loaded cached thumbnail information for %s broadcasts', len(instance._cache_dict))
+                # Setup saving
+                atexit.register(instance._save_cache)
+                cls._instances[filename] = instance
+            return cls._instances[filename]
 
     def _save_cache(self):
         self._thumbs_filename.write_text('\n'.join(f'{k}|{v}' for k, v in self._cache_dict.items()))
         log.info(f'Saved thumbnail information for {len(self._cache_dict)} broadcasts in {self._thumbs_filename}')
 
-    @property
-    def _thumbs_filename(self) -> Path:
-        """return the configured path for the thumbnail cache"""
-        return Path(tempfile.gettempdir()).joinpath(config.youtube['thumbnail_cache'])
-
     def __getitem__(self, item):
         self._accessed_keys.add(item)
         return self._cache_dict[item]
@@ -82,21 +95,72 @@ class ThumbnailCache(MutableMapping):
         self._cache_dict[key] = value
 
 
-def create_youtube(ct: ChurchTools, yt: YouTube, event: Event):
+class PublishedPage(TypedDict):
+    """State of a WordPress page as last published by CTLA"""
+    fragment: str
+    """The rendered template that was inserted into the page"""
+    modified: str
+    """The page's ``modified_gmt`` timestamp after publishing"""
+    inputs: str
+    """Digest of the template and the event variables the fragment was rendered from"""
+
+
+class PageCache:
+    """Local record of the WordPress pages published by CTLA, to avoid fetching unchanged pages"""
+
+    pages: dict[str, PublishedPage]
+    """Published state per page ID"""
+    _filename: Path
+    """The path of the page cache"""
+
+    def __init__(self):
+        self.pages = {}
+        self._filename = config.temp_path(config.wordpress['page_cache'])
+        if self._filename.exists():
+            self.pages = json.loads(self._filename.read_text())
+        log.info('Loaded cached publishing information for %s WordPress page(s)', len(self.pages))
+
+    def save(self):
+        self._filename.write_text(json.dumps(self.pages))
+        log.info('Saved publishing information for %s WordPress page(s) in %s', len(self.pages), self._filename)
+
+
+def create_youtube(ct: ChurchTools, yt: YouTube, event: Event, journal: Journal):
     """
     Create a YouTube broadcast for the given event and bind the stream id;
     then attach it and upload the link to ChurchTools.
 
+    The steps are recorded in the journal, so an interrupted creation is completed by :py:func:`recover_operations`.
     This still requires `update_youtube()` to be called in order to set all attributes correctly
 
     :param ct: ChurchTools API instance
     :param yt: YouTube service instance
     :param event: The event wanting a broadcast
+    :param journal: The journal of the active tenant
     """
-    bc: LiveBroadcast = yt.create_broadcast(event.title, event.start_time, event.yt_visibility)
-    bc = yt.bind_stream_to_broadcast(bc['id'], config.youtube['stream_key_id'])
+    op = journal.begin('youtube', event.id)
+    # Created with the final title, so that it can be found by title if the creation is interrupted
+    bc: Broadcast = yt.create_broadcast(event.yt_title, event.start_time, event.yt_visibility)
+    journal.record(op, 'created', bc.id)
+    bc = yt.bind_stream_to_broadcast(bc.id, config.youtube['stream_key_id'])
+    journal.record(op, 'bound')
     event.yt_broadcast = bc
-    link_file = ct.attach_link(event, config.churchtools['stream_attachment_name'], f'https://youtu.be/{bc['id']}')
+    event.yt_link = ct.attach_link(event, config.churchtools['stream_attachment_name'], f'https://youtu.be/{bc.id}')
+    journal.finish(op)
+
+
+def relink_youtube(ct: ChurchTools, event: Event):
+    """
+    Replace the event's missing or broken link with a link to its (recovered) broadcast
+
+    :param ct: ChurchTools API instance
+    :param event: The event with a broadcast attached
+    """
+    if event.yt_link:
+        ct.delete_link(event.yt_link.id)
+        event.yt_link = None
+    link_file = ct.attach_link(event, config.churchtools['stream_attachment_name'],
+                               f'https://youtu.be/{event.yt_broadcast.id}')
     if link_file:
         event.yt_link = link_file
 
@@ -127,27 +191,24 @@ def update_youtube(yt: YouTube, ev: Event) -> bool:
     if not ev.yt_broadcast:
         return False
     bc = ev.yt_broadcast
-    bc_snippet = bc.get('snippet', {})
     data = dict()
     change = False
 
     yt_title = ev.yt_title
-    if yt_title != bc_snippet.get('title'):
+    if yt_title != bc.title:
         data['title'] = yt_title
 
     yt_desc = ev.yt_description
-    if yt_desc != bc_snippet.get('description'):
+    if yt_desc != bc.description:
         data['desc'] = yt_desc
 
-    start_str = bc_snippet.get('scheduledStartTime')
-    if not start_str or ev.start_time != datetime.datetime.fromisoformat(start_str):
+    if ev.start_time != bc.scheduled_start:
         data['start'] = ev.start_time
 
-    end_str = bc_snippet.get('scheduledEndTime')
-    if not end_str or ev.end_time != datetime.datetime.fromisoformat(end_str):
+    if ev.end_time != bc.scheduled_end:
         data['end'] = ev.end_time
 
-    if ev.yt_visibility != bc['status']['privacyStatus']:
+    if ev.yt_visibility != bc.privacy_status:
         data['privacy'] = ev.yt_visibility
 
     if data:
@@ -156,7 +217,7 @@ def update_youtube(yt: YouTube, ev: Event) -> bool:
 
     # "instantiation" happens only once, because singleton
     thumbs_cache = ThumbnailCache()
-    yt_id = ev.yt_broadcast['id']
+    yt_id = ev.yt_broadcast.id
 
     target_thumbnail = ev.yt_thumbnail.url if ev.yt_thumbnail else _get_thumbnail_uri(ev.title)
     if thumbs_cache.get(yt_id, '') == target_thumbnail:
@@ -171,91 +232,141 @@ def update_youtube(yt: YouTube, ev: Event) -> bool:
     return change
 
 
-def _render_templates(events: list[Event]) -> dict[str, str]:
-    """
-    Populate the templates from config with the given events
-    :param events: The events to pull the data from
-    :return: A dictionary mapping the template keys to the compiled content
-    """
-    events = sorted(events, key=operator.attrgetter('start_time'))
-
-    # Render templates
-    active_templates = set(config.wordpress.get('pages').values())
-    rendered_templates: dict[str, str] = {}
-
-    for template_key in active_templates:
+def _active_templates() -> dict[str, Template]:
+    """The templates of all configured pages, by template key"""
+    templates: dict[str, Template] = {}
+    for template_key in set(config.wordpress.get('pages').values()):
         try:
-            template = Template(config.wordpress['content_templates'][template_key])
+            templates[template_key] = config.compiled.wordpress_templates[template_key]
         except KeyError:
             log.critical(f'Could not find template for key "{template_key}" in config "wordpress.content_templates".')
             exit(1)
+    return templates
+
+
+def _template_variables(events: list[Event]) -> list[dict[str, str]]:
+    """
+    Compute the substitution variables of the events shown on the homepage, in order of their start time
 
-        rendered = ''
+    :param events: The events to pull the data from
+    :return: The variables of each event
+    """
+    show_in_advance = datetime.timedelta(hours=config.wordpress['hours_to_show_in_advance'])
+    allow_parallel_display = config.wordpress['allow_parallel_display']
+    dateformat = config.compiled.dateformat
+
+    variables = []
+    prev_end: datetime = datetime.datetime.fromtimestamp(0, tz=datetime.UTC)
+    for event in sorted(events, key=operator.attrgetter('start_time')):
+        if not event.facts.on_homepage:
+            continue
+
+        # If the pre_time is before the end of the previous event and parallel display is disabled,
+        # Set its pre_time to the end of the previous event.
+        pre_time = event.start_time - show_in_advance
+        if not allow_parallel_display and pre_time < prev_end:
+            pre_time = prev_end
 
-        prev_end: datetime = datetime.datetime.fromtimestamp(0, tz=datetime.UTC)
-        for event in events:
-            if not event.facts.on_homepage:
-                continue
+        variables.append({
+            'title': event.title,
+            'pre_iso': pre_time.isoformat(),
+            'start_iso': event.start_time.isoformat(),
+            'end_iso': event.end_time.isoformat(),
+            'datetime': event.start_time.strftime(dateformat),
+            'video_link': event.yt_link.url,
+            'video_link_quoted': urllib.parse.quote(event.yt_link.url)
+        })
+        prev_end = event.end_time
+    return variables
 
-            # If the pre_time is before the end of the previous event and parallel display is disabled,
-            # Set its pre_time to the end of the previous event.
-            pre_time = event.start_time - datetime.timedelta(hours=config.wordpress['hours_to_show_in_advance'])
-            if not config.wordpress['allow_parallel_display'] and pre_time < prev_end:
-                pre_time = prev_end
 
-            rendered += '\n' + template.safe_substitute({
-                'title': event.title,
-                'pre_iso': pre_time.isoformat(),
-                'start_iso': event.start_time.isoformat(),
-                'end_iso': event.end_time.isoformat(),
-                'datetime': event.start_time.strftime(config.churchtools['templates']['dateformat']),
-                'video_link': event.yt_link.url,
-                'video_link_quoted': urllib.parse.quote(event.yt_link.url)
-            }) + '\n'
+def _inputs_digest(template: Template, variables: list[dict[str, str]]) -> str:
+    """Digest of everything a rendered template depends on, to detect pages whose events did not change"""
+    return hashlib.sha256(json.dumps([template.template, variables], sort_keys=True).encode()).hexdigest()
 
-            prev_end = event.end_time
 
-        rendered_templates[template_key] = rendered
-    return rendered_templates
+def _render_template(template: Template, variables: list[dict[str, str]]) -> str:
+    """Populate the template with the variables of each event"""
+    return ''.join(f'\n{template.safe_substitute(event_variables)}\n' for event_variables in variables)
 
 
 def update_wordpress(wp: WordPress, events: list[Event]):
     """
     Update all configured WordPress pages with event information
+
+    Pages are published concurrently. A template is only rendered if the events shown with it (or the template) changed
+    since its pages were last published, and a page is only fetched if its fragment or the page itself
+    (according to its modification date) changed.
+
     :param wp: The WordPress API instance
     :param events: The list of events to display in WordPress
     """
-    rendered_templates = _render_templates(events)
     log.info(f'Adding {len(events)} broadcast(s) to WordPress pages…')
+    pages: dict[str, str] = config.wordpress.get('pages', {})
+    cache = PageCache()
+    modified = wp.get_pages_modified([int(page_id) for page_id in pages]) if cache.pages else {}
+
+    templates = _active_templates()
+    variables = _template_variables(events)
+    inputs = {template_key: _inputs_digest(template, variables) for template_key, template in templates.items()}
+
+    # Render the templates whose inputs changed for any of their pages, reuse the published fragment otherwise
+    fragments: dict[str, str] = {}
+    for page_id, template_key in pages.items():
+        if template_key in fragments:
+            continue
+        published = cache.pages.get(page_id)
+        if published and published.get('inputs') == inputs[template_key]:
+            fragments[template_key] = published['fragment']
+        else:
+            fragments[template_key] = _render_template(templates[template_key], variables)
 
-    # Update all pages
-    for page_id, template_key in config.wordpress.get('pages', {}).items():
-        page = wp.get_page(page_id)
+    def publish(page_id: str, template_key: str):
+        fragment = fragments[template_key]
+        published = cache.pages.get(page_id)
+        if published and published['fragment'] == fragment and published['modified'] == modified.get(int(page_id)):
+            log.info('Did not fetch page %s because neither the content nor the page changed.', page_id)
+            return
 
-        new_page = WordPressPage.insert_content(page, rendered_templates[template_key])
+        page = wp.get_page(int(page_id))
+        new_page = WordPressPage.insert_content(page, fragment)
 
-        if new_page:
-            if new_page['content']['raw'] == page['content']['raw']:
-                log.info(f'Did not update page {page_id} because the content did not change.')
-                continue
-            wp.update_page(page_id, new_page)
-            log.info(f'Updated page {page_id}.')
-        else:
+        if not new_page:
             log.error(f'Could not update page {page_id} because the content could not be inserted.')
             raise RuntimeError
+        if new_page['content']['raw'] == page['content']['raw']:
+            log.info('Did not update page %s because the content did not change.', page_id)
+        else:
+            page = wp.update_page(int(page_id), new_page)
+            log.info('Updated page %s.', page_id)
+        cache.pages[page_id] = PublishedPage(fragment=fragment, modified=page['modified_gmt'],
+                                             inputs=inputs[template_key])
+
+    # Update all pages
+    try:
+        with utils.ContextThreadPoolExecutor(max_workers=config.wordpress['max_parallel_requests']) as executor:
+            for future in [executor.submit(publish, page_id, key) for page_id, key in pages.items()]:
+                future.result()
+    finally:
+        cache.save()
 
 
-def create_post(ct: ChurchTools, event: Event):
+def create_post(ct: ChurchTools, event: Event, journal: Journal):
     """
     Create a post for the given event and add it to the attachments
+
+    The steps are recorded in the journal, so an interrupted creation is completed by :py:func:`recover_operations`.
+
     :param ct: ChurchTools API instance
     :param event: Event to act on
+    :param journal: The journal of the active tenant
     """
     # Post creation must not backdate a post
     now = datetime.datetime.now(datetime.UTC)
     date = event.end_time
     if date < now:
         date = now + timedelta(days=1)
+    op = journal.begin('post', event.id)
     post_id = ct.create_post(
         group_id=config.churchtools['post_settings']['group_id'],
         title=event.post_title,
@@ -264,26 +375,140 @@ def create_post(ct: ChurchTools, event: Event):
         visibility=config.churchtools['post_settings']['post_visibility'],
         comments_active=config.churchtools['post_settings']['comments_active']
     )
-    event.post_link = ct.attach_link(
+    journal.record(op, 'created', post_id)
+    event.post_link = _attach_post_link(ct, event, post_id)
+    journal.finish(op)
+
+    if date != event.end_time:
+        # Post should be backdated but isn't: immediately update (updating a post allows backdating)
+        update_post(ct, event)
+
+
+def _attach_post_link(ct: ChurchTools, event: Event, post_id: int):
+    """Attach the link to the post to the event"""
+    return ct.attach_link(
         event=event,
         name=config.churchtools['post_settings']['attachment_name'],
         link=urllib.parse.urlunsplit(('https', config.churchtools['instance'], f'/posts/{post_id}', '', ''))
     )
 
-    if date != event.end_time:
-        # Post should be backdated but isn't: immediately update (updating a post allows backdating)
-        update_post(ct, event)
+
+def recover_operations(ct: ChurchTools, yt: YouTube, journal: Journal, events: list[Event],
+                       claim: Optional[Callable[[int], bool]] = None):
+    """
+    Resume or roll back the operations of a previous run that were interrupted (see :py:mod:`journal`).
+
+    An object that was created, but not linked yet, is linked if its event still wants it and has no other one.
+    Otherwise, it is deleted. Operations whose object was not created are dropped: a broadcast created without its
+    ID being recorded is found again by title and start time (see :py:class:`setup.BroadcastIndex`).
+
+    Must be called after the broadcasts were attached to the events. Operations that fail remain in the journal.
+
+    :param ct: ChurchTools API instance
+    :param yt: YouTube service instance
+    :param journal: The journal of the active tenant
+    :param events: All events gathered in this run
+    :param claim: Called with the event ID before recovering an operation. Operations of events it returns False for
+        (e.g. as another worker holds their lease) are left in the journal
+    """
+    events_by_id = {event.id: event for event in events}
+    for op in list(journal.pending.values()):
+        if claim and not claim(op.event_id):
+            log.info('Not recovering %s operation for event %s, it is handled by another worker.', op.kind, op.event_id)
+            continue
+        event = events_by_id.get(op.event_id)
+        try:
+            if op.kind == 'youtube':
+                _recover_youtube(ct, yt, op, event)
+            else:
+                _recover_post(ct, op, event)
+        except UPSTREAM_ERRORS as e:
+            log.error('Could not recover %s operation for event %s, will retry next run: %s', op.kind, op.event_id, e)
+            continue
+        journal.finish(op)
+
+
+def _recover_youtube(ct: ChurchTools, yt: YouTube, op: Operation, event: Optional[Event]):
+    """Link or delete the broadcast created by an interrupted :py:func:`create_youtube`"""
+    bc_id = op.steps.get('created')
+    if bc_id is None:
+        if event and event.yt_broadcast:
+            log.info('Creation of broadcast for event %s was interrupted, found broadcast %s by title and start time.',
+                     op.event_id, event.yt_broadcast.id)
+        elif event and event.wants_stream:
+            log.warning('Creation of broadcast for event %s was interrupted and no broadcast was found by title and '
+                        'start time. If one was created anyway, it can be removed with --gc.', op.event_id)
+        return
+
+    if not event or not event.wants_stream or (event.yt_broadcast and event.yt_broadcast.id != bc_id):
+        if yt.get_broadcast_with_id(bc_id):
+            log.info('Rolling back creation of broadcast %s, event %s does not need it anymore.', bc_id, op.event_id)
+            yt.delete_broadcast(bc_id)
+        return
+
+    bc = event.yt_broadcast or yt.get_broadcast_with_id(bc_id)
+    if not bc:
+        log.warning('Broadcast %s created for event %s does not exist anymore.', bc_id, op.event_id)
+        return
+    log.info('Resuming creation of broadcast %s for %s.', bc_id, event)
+    if 'bound' not in op.steps:
+        bc = yt.bind_stream_to_broadcast(bc_id, config.youtube['stream_key_id'])
+    event.yt_broadcast = bc
+    if event.youtube_video_id != bc_id:
+        relink_youtube(ct, event)
+
+
+def _recover_post(ct: ChurchTools, op: Operation, event: Optional[Event]):
+    """Link or delete the post created by an interrupted :py:func:`create_post`"""
+    post_id = op.steps.get('created')
+    if post_id is None:
+        log.warning('Creation of post for event %s was interrupted, a post without link may have been created in '
+                    'group %s.', op.event_id, config.churchtools['post_settings']['group_id'])
+        return
+
+    if event and event.wants_stream and event.facts.create_post and not event.post_link:
+        # The post itself is brought up-to-date by the following synchronisation
+        log.info('Resuming creation of post %s for %s.', post_id, event)
+        event.post_link = _attach_post_link(ct, event, post_id)
+    elif ct.post_exists(post_id):
+        log.info('Rolling back creation of post %s, event %s does not need it anymore.', post_id, op.event_id)
+        ct.delete_post(post_id)
 
 
-def update_post(ct: ChurchTools, event: Event) -> bool:
+def fetch_posts(ct: ChurchTools, events: list[Event]) -> dict[int, dict]:
+    """
+    Fetch the posts linked to the given events in bulk
+
+    :param ct: ChurchTools API instance
+    :param events: Events whose posts will be fetched
+    :return: The post data (post id : data). Posts that could not be found in the first pages of the post group
+        are omitted, :py:func:`update_post` fetches them individually.
+    """
+    post_ids = set()
+    for event in events:
+        if not event.post_link:
+            continue
+        post_id = parse_post_id(event.post_link.url)
+        if post_id is None:
+            log.warning('Could not parse post id from "%s" of %s, not fetching its post.', event.post_link.url, event)
+            continue
+        post_ids.add(post_id)
+    if not post_ids:
+        return {}
+    return ct.get_posts(config.churchtools['post_settings']['group_id'], post_ids)
+
+
+def update_post(ct: ChurchTools, event: Event, post: dict = None) -> bool:
     """
     Updates the Post for an event, if necessary
 
     :param ct: ChurchTools API instance
     :param event: Event to act on
+    :param post: The current post data, if already fetched (see :py:func:`fetch_posts`). Fetched if not given.
     :return: True if the post was updated
     """
-    post = ct.get_post(event.post_id)
+    if post is None:
+        post = ct.get_post(event.post_id)
 
     title = event.post_title
     content = event.post_content
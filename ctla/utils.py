@@ -1,3 +1,11 @@
+import contextvars
+import math
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Optional
+
+
 def combine_into(delta: dict, combined: dict) -> None:
     """
     Recursively combine dictionaries together, with `delta` taking priority in choosing the value for non-dict entries.
@@ -9,3 +17,39 @@ def combine_into(delta: dict, combined: dict) -> None:
             combine_into(v, combined.setdefault(k, {}))
         else:
             combined[k] = v
+
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """
+    ``ThreadPoolExecutor`` that runs each task in a copy of the submitting thread's context.
+
+    This keeps context-local state (like the active configuration) available inside the worker threads.
+    """
+
+    def submit[T](self, fn: Callable[..., T], /, *args, **kwargs) -> Future[T]:
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+class Deadline:
+    """Point in time by which a run has to be finished"""
+
+    _end: Optional[float]
+    """``time.monotonic()`` value of the deadline, or ``None`` if there is none"""
+
+    def __init__(self, seconds: float):
+        """
+        :param seconds: Seconds from now until the deadline. ``0`` or less means there is no deadline
+        """
+        self._end = time.monotonic() + seconds if seconds > 0 else None
+
+    def remaining(self) -> float:
+        """Seconds left until the deadline (``math.inf`` if there is none)"""
+        return math.inf if self._end is None else self._end - time.monotonic()
+
+    def expired(self, reserve: float = 0) -> bool:
+        """Whether the deadline has passed, or less than ``reserve`` seconds are left"""
+        return self.remaining() <= reserve
+
+
+run_deadline: contextvars.ContextVar[Deadline] = contextvars.ContextVar('run_deadline', default=Deadline(0))
+"""Deadline of the run in the current context"""
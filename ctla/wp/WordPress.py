@@ -3,10 +3,14 @@ import urllib.parse
 
 import config
 from RestAPI import RestAPI
+from breaker import CircuitBreaker
 from wp.WordPressPage import WordPressPage
 
 log = logging.getLogger(__name__)
 
+PAGE_FIELDS = 'id,title.raw,content.raw,modified_gmt'
+"""Fields of a page used by :py:mod:`wp.WordPressPage` and the page cache"""
+
 
 class WordPress(RestAPI):
     """
@@ -33,6 +37,7 @@ class WordPress(RestAPI):
 
         self.urlbase = urllib.parse.urljoin(url, '/wp-json/wp/v2')
         self._auth = user, pwd
+        self.breaker = CircuitBreaker('WordPress')
 
         log.info('Initialized WordPress API.')
 
@@ -44,22 +49,49 @@ class WordPress(RestAPI):
         :return: The page
         """
         log.info(f'Fetching WordPress page {page_id}…')
-        r = self._do_get(f'/pages/{page_id}', context='edit')
+        r = self._do_get(f'/pages/{page_id}', context='edit', _fields=PAGE_FIELDS)
         if r.status_code != 200:
             log.error(f'Could not fetch wordpress pages: {r.reason}')
             r.raise_for_status()
 
         return r.json()
 
-    def update_page(self, page_id: int, page: WordPressPage):
+    def get_pages_modified(self, page_ids: list[int]) -> dict[int, str]:
+        """
+        Retrieve the last modification timestamps of the given pages in one request per 100 pages
+
+        :param page_ids: The ``id``s of the pages to look up
+        :return: Mapping of page ID to its ``modified_gmt`` timestamp. Pages that could not be found are omitted.
+        """
+        log.info('Fetching modification dates of %s WordPress page(s)…', len(page_ids))
+        modified = {}
+        for i in range(0, len(page_ids), 100):
+            chunk = page_ids[i:i + 100]
+            r = self._do_get(
+                '/pages',
+                include=','.join(str(page_id) for page_id in chunk),
+                per_page=len(chunk),
+                status='publish,future,draft,pending,private',
+                _fields='id,modified_gmt'
+            )
+            if r.status_code != 200:
+                log.error('Could not fetch wordpress page modification dates: %s', r.reason)
+                r.raise_for_status()
+            modified |= {page['id']: page['modified_gmt'] for page in r.json()}
+        return modified
+
+    def update_page(self, page_id: int, page: WordPressPage) -> WordPressPage:
         """
         Update the WordPress page with id ``page_id`` and the given data
         :param page_id: ID of the page to update
         :param page: Page data to upload
+        :return: The updated page, containing only its ``id`` and ``modified_gmt``
         """
         log.info(f'Updating wordpress page {page_id}')
         # noinspection PyTypeChecker
-        r = self._do_post(f'/pages/{page_id}', page)
+        r = self._do_post(f'/pages/{page_id}', page, _fields='id,modified_gmt')
         if r.status_code != 200:
             log.error(f'Could not update page {page_id}: {r.reason}')
             r.raise_for_status()
+
+        return r.json()
@@ -1,23 +1,16 @@
 """TypedDict classes for type hints"""
 import base64
+import functools
 import logging
 import re
 import urllib.parse
-from typing import TypedDict, NamedTuple, NotRequired, Any, Optional
+from typing import TypedDict, NotRequired, Optional
 
 import config
 
 log = logging.getLogger(__name__)
 
 
-class WordPressContentPart(NamedTuple):
-    """Metadata holder for a WordPress page content substring"""
-    content: str
-    """The content part"""
-    isTemplate: bool
-    """Whether this content part is inside a CTLA-Tag"""
-
-
 class WordPressContent(TypedDict):
     """
     The ``content`` field of WordPress pages
@@ -31,82 +24,74 @@ class WordPressPage(TypedDict):
     """
     title: NotRequired[WordPressContent]
     id: NotRequired[int]
+    modified_gmt: NotRequired[str]
     content: WordPressContent
 
 
+@functools.cache
+def _template_tags(content_tag: str) -> tuple[str, str]:
+    """Build the opening and closing tags for ``content_tag``"""
+    return f'<!-- {content_tag} -->', f'<!-- /{content_tag} -->'
+
+
+@functools.cache
+def _bakery_pattern(content_tag: str) -> re.Pattern:
+    """Compile the pattern matching the contents of WPBakery raw html blocks with class ``content_tag``"""
+    return re.compile(rf'(?<=\[vc_raw_html el_class="{re.escape(content_tag)}"])[a-zA-Z0-9+=/]*?(?=\[/vc_raw_html])')
+
+
 def template_tags() -> tuple[str, str]:
     """
     The HTML-Comment "tags" to use for determining where to put our generated content
     :return: A tuple containing the opening and closing tags
     """
-    return f'<!-- {config.wordpress['content_tag']} -->', f'<!-- /{config.wordpress['content_tag']} -->'
+    return _template_tags(config.wordpress['content_tag'])
 
 
-def split_page_content(page: WordPressPage) -> Optional[list[Any]]:
-    """
-    Split the page's content into parts at the CTLA-Tag comments defined in config with ``wordpress.content-tag``
-    :param page: The page which content is to be split
-    :return: A list of split contents
+def _scan_template_offsets(raw: str) -> Optional[list[tuple[int, int]]]:
     """
-    tag_open, tag_close = template_tags()
-    parts = []
-
-    is_in_tag = False
-    remaining = page['content']['raw']
-    while True:
-        current_tag = tag_close if is_in_tag else tag_open
+    Scan the content once for the CTLA-Tag comments
 
-        split = remaining.split(current_tag, maxsplit=1)
-        part = split[0]
-
-        parts.append(WordPressContentPart(content=part, isTemplate=is_in_tag))
-
-        is_in_tag = not is_in_tag
-
-        if split[1]:
-            remaining = split[1]
-        else:
-            if is_in_tag:
-                log.warning(f'Missing close tag in page "{page['title']['raw']}". Refusing to overwrite.')
-                return None
-            break
-
-    return parts
-
-
-def reassemble_page(parts: list[WordPressContentPart]) -> WordPressPage:
-    """
-    Reassemble content parts into one ``WordPressPage``
-    :param parts: The parts to reassemble
-    :return: The reassembled page
+    :param raw: The raw page content
+    :return: The ``(start, end)`` offsets of the contents between each pair of tags,
+        or ``None`` if a closing tag is missing
     """
     tag_open, tag_close = template_tags()
+    offsets = []
 
-    content = ''
+    pos = 0
+    while (start := raw.find(tag_open, pos)) != -1:
+        start += len(tag_open)
+        end = raw.find(tag_close, start)
+        if end == -1:
+            return None
+        offsets.append((start, end))
+        pos = end + len(tag_close)
 
-    for part, is_template in parts:
-        if is_template:
-            content += tag_open + part + tag_close
-        else:
-            content += part
-
-    return WordPressPage(content=WordPressContent(raw=content))
+    return offsets
 
 
 def _insert_plain_content(page: WordPressPage, content: str) -> Optional[WordPressPage]:
     """Implementation for :py:func:`insert_content` in normal mode (``config.wordpress.wpbakery_compat`` is disabled)"""
-    content_parts = split_page_content(page)
-    if not content_parts:
+    raw = page['content']['raw']
+    offsets = _scan_template_offsets(raw)
+    if offsets is None:
+        log.warning('Missing close tag in page "%s". Refusing to overwrite.', page['title']['raw'])
+        return None
+    if not offsets:
+        log.warning('No content tags found in page "%s".', page['title']['raw'])
         return None
 
-    new_parts: list[WordPressContentPart] = []
-    for part in content_parts:
-        if part.isTemplate:
-            new_parts.append(WordPressContentPart(content=content, isTemplate=True))
-        else:
-            new_parts.append(part)
+    # Splice the content between all tags in one go
+    pieces = []
+    pos = 0
+    for start, end in offsets:
+        pieces.append(raw[pos:start])
+        pieces.append(content)
+        pos = end
+    pieces.append(raw[pos:])
 
-    return reassemble_page(new_parts)
+    return WordPressPage(content=WordPressContent(raw=''.join(pieces)))
 
 
 def _insert_bakery_content(page: WordPressPage, content: str) -> Optional[WordPressPage]:
@@ -114,9 +99,8 @@ def _insert_bakery_content(page: WordPressPage, content: str) -> Optional[WordPr
     # Quote and encode the content
     content = base64.b64encode(urllib.parse.quote(content, safe='').encode('utf-8')).decode('utf-8')
 
-    new_content, n = re.subn(
-        rf'(?<=\[vc_raw_html el_class="{config.wordpress['content_tag']}"])[a-zA-Z0-9+=/]*?(?=\[/vc_raw_html])',
-        content,
+    new_content, n = _bakery_pattern(config.wordpress['content_tag']).subn(
+        lambda _: content,
         page['content']['raw']
     )
     log.info(f'Inserted content {n} times into "{page['title']['raw']}" (#{page['id']})')
@@ -0,0 +1,67 @@
+import dataclasses
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Self
+
+from .type_hints import LiveBroadcast, PrivacyStatus
+
+
+@dataclass(frozen=True, slots=True)
+class Broadcast:
+    """
+    Compact record of a YouTube broadcast
+
+    Holds only the fields of the ``LiveBroadcast`` resource that are used in this application,
+    so the full API response can be discarded
+    """
+    id: str
+    title: str
+    description: str
+    scheduled_start: Optional[datetime]
+    scheduled_end: Optional[datetime]
+    privacy_status: PrivacyStatus
+    life_cycle_status: str
+
+    @classmethod
+    def from_api_json(cls, resource: LiveBroadcast) -> Self:
+        """Create instance from a ``LiveBroadcast`` resource returned by the API"""
+        snippet = resource.get('snippet', {})
+        status = resource.get('status', {})
+        return cls(
+            id=resource['id'],
+            title=snippet.get('title', ''),
+            description=snippet.get('description', ''),
+            scheduled_start=_parse_time(snippet.get('scheduledStartTime')),
+            scheduled_end=_parse_time(snippet.get('scheduledEndTime')),
+            privacy_status=status.get('privacyStatus'),
+            life_cycle_status=status.get('lifeCycleStatus')
+        )
+
+    def updated(self, resource: LiveBroadcast) -> Self:
+        """
+        Merge a (partial) ``LiveBroadcast`` resource into this record
+
+        :param resource: The resource returned by the API, containing only some parts
+        :return: The new record
+        """
+        changes = {}
+        if 'snippet' in resource:
+            snippet = resource['snippet']
+            changes |= dict(
+                title=snippet.get('title', self.title),
+                description=snippet.get('description', self.description),
+                scheduled_start=_parse_time(snippet.get('scheduledStartTime')) or self.scheduled_start,
+                scheduled_end=_parse_time(snippet.get('scheduledEndTime')) or self.scheduled_end
+            )
+        if 'status' in resource:
+            status = resource['status']
+            changes |= dict(
+                privacy_status=status.get('privacyStatus', self.privacy_status),
+                life_cycle_status=status.get('lifeCycleStatus', self.life_cycle_status)
+            )
+        return dataclasses.replace(self, **changes)
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    """Parse an ISO timestamp from the API, if set"""
+    return datetime.fromisoformat(value) if value else None
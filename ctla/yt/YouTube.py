@@ -1,45 +1,120 @@
+import json
 import logging
 import mimetypes
 import os
 import shutil
 import tempfile
+import time
 import urllib.parse
-import urllib.request
-from datetime import datetime
-from http.client import HTTPResponse
+from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Optional, Any
 
+import google.auth.exceptions
+import google_auth_httplib2
+import httplib2
 import googleapiclient.discovery
-from google.oauth2.credentials import Credentials
-from googleapiclient.http import MediaIoBaseUpload
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload, HttpRequest
 
+import cassette
 import config
-import utils
+import logs
+from breaker import CircuitBreaker
 from . import oauth
-from .type_hints import LiveBroadcast, PrivacyStatus
+from .Broadcast import Broadcast
+from .type_hints import PrivacyStatus
 
 log = logging.getLogger(__name__)
 
-DEFAULT_PART = 'id,snippet,contentDetails,status'  # Default value for 'part' parameter in requests
+BROADCAST_PART = 'id,snippet,status'
+"""Parts of ``LiveBroadcast`` resources read by :py:class:`Broadcast`"""
+WRITE_PART = 'id,snippet,contentDetails,status'
+"""Parts set when creating a broadcast"""
+BROADCAST_FIELDS = ('id,snippet(title,description,scheduledStartTime,scheduledEndTime),'
+                    'status(privacyStatus,lifeCycleStatus)')
+"""Field mask for the ``LiveBroadcast`` fields read by :py:class:`Broadcast`"""
+LIST_FIELDS = f'etag,items({BROADCAST_FIELDS})'
+"""Field mask for broadcast lists, including the ``etag`` for conditional requests"""
+
+LIST_COST = 1
+"""Quota cost of list requests"""
+WRITE_COST = 50
+"""Quota cost of insert, update, bind, delete and thumbnail requests"""
+
+
+class QuotaExceededError(RuntimeError):
+    """Raised if a request would exceed the quota configured with ``youtube.quota_per_run``"""
+
+
+class CountingHttp(google_auth_httplib2.AuthorizedHttp):
+    """
+    Authorized HTTP client counting requests, the time spent waiting for them and the size of received response bodies.
+
+    All requests go through the :py:attr:`breaker`, if set.
+    """
+
+    breaker: Optional[CircuitBreaker] = None
+    requests_sent: int = 0
+    bytes_received: int = 0
+    request_seconds: float = 0.0
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        if self.breaker:
+            self.breaker.before_request()
+        recorder = cassette.active()
+        start = time.perf_counter()
+        try:
+            if recorder:
+                response, content = cassette.send_httplib2(recorder, super().request, uri, method, body,
+                                                           headers=headers, **kwargs)
+            else:
+                response, content = super().request(uri, method, body, headers, **kwargs)
+        except (OSError, httplib2.HttpLib2Error, google.auth.exceptions.TransportError):
+            if self.breaker:
+                self.breaker.record(None)
+            raise
+        if self.breaker:
+            self.breaker.record(response.status)
+        self.requests_sent += 1
+        self.bytes_received += len(content or b'')
+        self.request_seconds += time.perf_counter() - start
+        return response, content
 
 
 class YouTube:
     """
     YouTube-API main class
     """
-    credentials: Credentials
+    credentials: oauth.PersistentCredentials
+    _http: CountingHttp
     _service: googleapiclient.discovery.Resource
+    quota_used: int = 0
+    """Quota units used since the last call to :py:meth:`reset_quota`"""
+    etag_requests: int = 0
+    """Conditional list requests since the last call to :py:meth:`reset_quota`"""
+    etag_hits: int = 0
+    """Conditional list requests answered with ``304 Not Modified`` since the last call to :py:meth:`reset_quota`"""
+    _etag_cache: dict[str, dict]
+    """Last response (including its ``etag``) per request URI"""
+    _etag_used: set[str]
+    """Request URIs used since the last save, only those are kept when saving"""
 
     def __init__(self):
         log.info('Initializing YouTube API…')
         # Obtain Credentials
         self.credentials = oauth.load_credentials()
-        if self.credentials is None:
+        # Replayed requests are not authorized
+        if self.credentials is None and not cassette.replaying():
             self.credentials = oauth.authorize()
 
+        self._load_etag_cache()
+
         # Create client
-        self._service = googleapiclient.discovery.build('youtube', 'v3', credentials=self.credentials)
+        # httplib2 only supports a single timeout for connecting and reading
+        self._http = CountingHttp(self.credentials, http=httplib2.Http(timeout=config.timeouts['read']))
+        self._http.breaker = CircuitBreaker('YouTube')
+        self._service = googleapiclient.discovery.build('youtube', 'v3', http=self._http)
         self._live_broadcasts = self._service.liveBroadcasts()
 
         self.check_stream_key_configured()
@@ -58,6 +133,82 @@ class YouTube:
             )
             exit(1)
 
+    def reset_quota(self):
+        """Reset the used quota and the request counters, e.g. at the start of a new run"""
+        self.quota_used = 0
+        self.etag_requests = 0
+        self.etag_hits = 0
+
+    def _load_etag_cache(self):
+        self._etag_cache = {}
+        self._etag_used = set()
+        filename = config.temp_path(config.youtube['etag_cache'])
+        if filename.exists():
+            self._etag_cache = json.loads(filename.read_text())
+        log.info('Loaded %s cached YouTube response(s)', len(self._etag_cache))
+
+    def save_etag_cache(self):
+        """Save the responses used since the last save, so the next run can send conditional requests"""
+        self._etag_cache = {uri: self._etag_cache[uri] for uri in self._etag_used if uri in self._etag_cache}
+        self._etag_used = set()
+        filename = config.temp_path(config.youtube['etag_cache'])
+        filename.write_text(json.dumps(self._etag_cache))
+        log.info('Saved %s YouTube response(s) in %s', len(self._etag_cache), filename)
+
+    def _execute_conditional(self, request: HttpRequest) -> dict:
+        """
+        Execute a list request with ``If-None-Match``, reusing the cached response if it is unchanged
+
+        :param request: The prepared request
+        :return: The response, or the cached response if the server answered ``304 Not Modified``
+        """
+        self._etag_used.add(request.uri)
+        self.etag_requests += 1
+        cached = self._etag_cache.get(request.uri)
+        if cached:
+            request.headers['If-None-Match'] = cached['etag']
+        try:
+            response = request.execute()
+        except HttpError as e:
+            if cached and e.resp.status == 304:
+                self.etag_hits += 1
+                return cached
+            raise
+        if 'etag' in response:
+            self._etag_cache[request.uri] = response
+        return response
+
+    def has_quota(self, units: int) -> bool:
+        """Whether ``units`` quota units can still be used in this run"""
+        limit = config.youtube.get('quota_per_run') or 0
+        return not limit or self.quota_used + units <= limit
+
+    def _use_quota(self, units: int):
+        """
+        Account for a request costing ``units`` quota units
+
+        :raise QuotaExceededError: if the request would exceed the configured quota
+        """
+        if not self.has_quota(units):
+            raise QuotaExceededError(f'Request would exceed the YouTube quota of {config.youtube['quota_per_run']} '
+                                     f'units for this run ({self.quota_used} used)')
+        self.quota_used += units
+
+    @property
+    def requests_sent(self) -> int:
+        """Number of requests sent to the API"""
+        return self._http.requests_sent
+
+    @property
+    def bytes_received(self) -> int:
+        """Size of all response bodies received from the API"""
+        return self._http.bytes_received
+
+    @property
+    def request_seconds(self) -> float:
+        """Time spent waiting for responses from the API"""
+        return self._http.request_seconds
+
     def format_stream_keys(self) -> str:
         """Obtain and format configured stream keys for printing to console"""
         return (
@@ -69,49 +220,83 @@ class YouTube:
         """
         Return all configured stream keys (id -> title)
         """
-        return {
-            sk['id']: sk['snippet']['title']
-            for sk in
-            self._service.liveStreams().list(part='snippet', mine=True, maxResults=50).execute()['items']
-        }
+        self._use_quota(LIST_COST)
+        response = self._execute_conditional(self._service.liveStreams().list(
+            part='snippet', mine=True, maxResults=50, fields='etag,items(id,snippet/title)'))
+        return {sk['id']: sk['snippet']['title'] for sk in response['items']}
 
-    def close(self):
-        oauth.save_credentials(self.credentials)
-        log.info('Saved YouTube access token.')
+    def refresh_token_ahead(self):
+        """
+        Refresh the access token now if it would expire within ``youtube.token_refresh_margin`` seconds.
+
+        Refreshed tokens are saved right away, so later runs and other workers can reuse them.
+        """
+        if cassette.replaying():
+            return
+        self.credentials.refresh_ahead(timedelta(seconds=config.youtube['token_refresh_margin']),
+                                      config.timeouts['read'])
 
-    def get_active_and_upcoming_broadcasts(self) -> list[LiveBroadcast]:
+    def get_active_and_upcoming_broadcasts(self) -> list[Broadcast]:
         """
         Return all scheduled and active broadcasts
         """
         log.info('Collecting broadcasts from YouTube…')
+        self._use_quota(2 * LIST_COST)
         # Get upcoming and active broadcasts
-        upcoming_response = self._live_broadcasts.list(part=DEFAULT_PART, maxResults=50,
-                                                       broadcastStatus='upcoming').execute()
-        active_response = self._live_broadcasts.list(part=DEFAULT_PART, maxResults=50,
-                                                     broadcastStatus='active').execute()
-        return upcoming_response['items'] + active_response['items']
+        upcoming_response = self._execute_conditional(self._live_broadcasts.list(
+            part=BROADCAST_PART, fields=LIST_FIELDS, maxResults=50, broadcastStatus='upcoming'))
+        active_response = self._execute_conditional(self._live_broadcasts.list(
+            part=BROADCAST_PART, fields=LIST_FIELDS, maxResults=50, broadcastStatus='active'))
+        return [Broadcast.from_api_json(bc) for bc in upcoming_response['items'] + active_response['items']]
+
+    def get_upcoming_broadcasts_bound_to(self, stream_id: str) -> list[Broadcast]:
+        """
+        Return all upcoming broadcasts of the channel that are bound to the given stream and have not gone live yet
 
-    def get_broadcast_with_id(self, br_id: str) -> Optional[LiveBroadcast]:
+        :param stream_id: The ID of the stream (key) the broadcasts need to be bound to
+        :return: The broadcasts in the ``created`` or ``ready`` state
+        """
+        log.info('Collecting all upcoming broadcasts bound to stream "%s"…', stream_id)
+        broadcasts = []
+        page_token = None
+        while True:
+            self._use_quota(LIST_COST)
+            response = self._live_broadcasts.list(
+                part='id,snippet,status,contentDetails', maxResults=50, broadcastStatus='upcoming',
+                pageToken=page_token,
+                fields=f'nextPageToken,items({BROADCAST_FIELDS},contentDetails/boundStreamId)'
+            ).execute()
+            broadcasts += [
+                Broadcast.from_api_json(bc) for bc in response.get('items', [])
+                if bc.get('contentDetails', {}).get('boundStreamId') == stream_id
+                and bc['status']['lifeCycleStatus'] in {'created', 'ready'}
+            ]
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return broadcasts
+
+    def get_broadcast_with_id(self, br_id: str) -> Optional[Broadcast]:
         """
         Fetch a broadcast with the given id
         :param br_id: The ID of the broadcast to retrieve
         :return: The broadcast, or None, if it wasn't found
         """
-        log.info(f'Attempting to retrieve broadcast "{br_id}" from YouTube…')
+        log.info('Attempting to retrieve broadcast "%s" from YouTube…', br_id, extra=logs.SAMPLED)
+        self._use_quota(LIST_COST)
         live_broadcasts = self._service.liveBroadcasts()
-        result = live_broadcasts.list(id=br_id, part=DEFAULT_PART).execute()
+        result = self._execute_conditional(live_broadcasts.list(id=br_id, part=BROADCAST_PART, fields=LIST_FIELDS))
         try:
-            return result['items'][0]
+            return Broadcast.from_api_json(result['items'][0])
         except (KeyError, IndexError):
             return None
 
-    def create_broadcast(self, title: str, start: datetime, privacy: PrivacyStatus) -> LiveBroadcast:
+    def create_broadcast(self, title: str, start: datetime, privacy: PrivacyStatus) -> Broadcast:
         # noinspection GrazieInspection
         """
         Create a new `LiveBroadcast` and return it.
 
         This applies the configuration from "youtube.broadcast_settings" in the config file
-        :return: the newly created LiveBroadcast resource
+        :return: the newly created broadcast
         """
         if len(title) > 100:
             raise ValueError('Title may not be longer than 100 characters')
@@ -121,7 +306,8 @@ class YouTube:
         broadcast_settings = config.youtube['broadcast_settings']
 
         log.info(f'Creating new broadcast "{title}"…')
-        result = self._live_broadcasts.insert(part=DEFAULT_PART, body={
+        self._use_quota(WRITE_COST)
+        result = self._live_broadcasts.insert(part=WRITE_PART, fields=BROADCAST_FIELDS, body={
             'snippet'       : {
                 'title': title,
                 'scheduledStartTime': start.astimezone(None).isoformat(),
@@ -143,71 +329,74 @@ class YouTube:
                 'enableAutoStop'   : broadcast_settings['enable_auto_stop'],
             }
         }).execute()
-        return result
+        return Broadcast.from_api_json(result)
 
-    def set_broadcast_info(self, broadcast: LiveBroadcast, title: str = None, desc: str = None, start: datetime = None,
-                           end: datetime = None, privacy: PrivacyStatus = None) -> LiveBroadcast:
+    def set_broadcast_info(self, broadcast: Broadcast, title: str = None, desc: str = None, start: datetime = None,
+                           end: datetime = None, privacy: PrivacyStatus = None) -> Broadcast:
         """
         Update the broadcast information with the one given.
         Optional parameters may be omitted, in which case they won't be updated
 
-        :param broadcast: The ID of the broadcast to update
+        :param broadcast: The broadcast to update
         :param title: The title to set. Must be at most 100 characters long and may not contain '<' or '>'
         :param desc: The description of the broadcast. Restrictions like for title, but 5000 bytes in length
         :param start: The scheduled time
         :param end: The scheduled end time
         :param privacy: The visibility of the broadcast
-        :return: The updated LiveBroadcast resource. This property will have been merged with the passed `broadcast`,
+        :return: The updated broadcast. The result of the request will have been merged with the passed `broadcast`,
             since not all parts are updated in this request
-            (at least all 'contentDetails' settings always remain untouched)
         """
         parts_to_update = {'id'}
-        body: dict[str, Any] = {'id': broadcast['id']}
+        body: dict[str, Any] = {'id': broadcast.id}
         # Insert defined parameters into `body`
         if title or desc or start or end:
             parts_to_update.add('snippet')
+            start = start or broadcast.scheduled_start
+            end = end or broadcast.scheduled_end
             body['snippet'] = {
-                'title'           : title if title else broadcast['snippet']['title'],
-                'description'     : desc if desc else broadcast['snippet']['description'],
-                'scheduledStartTime': start.astimezone(None).isoformat() if start else broadcast['snippet'][
-                    'scheduledStartTime'],
-                'scheduledEndTime': end.astimezone(None).isoformat() if end else broadcast['snippet'][
-                    'scheduledEndTime']
+                'title'           : title if title else broadcast.title,
+                'description'     : desc if desc else broadcast.description,
+                'scheduledStartTime': start.astimezone(None).isoformat() if start else None,
+                'scheduledEndTime': end.astimezone(None).isoformat() if end else None
             }
 
         if privacy:
             parts_to_update.add('status')
             body['status'] = {'privacyStatus': privacy}
 
-        log.info('Updating broadcast "%s"', broadcast['id'])
-        log.debug('Setting broadcast information to %s', repr(body))
-        result = self._live_broadcasts.update(part=','.join(parts_to_update), body=body).execute()
+        log.info('Updating broadcast "%s"', broadcast.id)
+        self._use_quota(WRITE_COST)
+        log.debug('Setting broadcast information to %r', body)
+        result = self._live_broadcasts.update(part=','.join(parts_to_update), fields=BROADCAST_FIELDS,
+                                              body=body).execute()
         # noinspection PyTypeChecker
-        utils.combine_into(result, broadcast)
-        return broadcast
+        return broadcast.updated(result)
 
-    def bind_stream_to_broadcast(self, br_id: str, stream_id: Optional[str] = None) -> LiveBroadcast:
+    def bind_stream_to_broadcast(self, br_id: str, stream_id: Optional[str] = None) -> Broadcast:
         """
         Bind a stream to the broadcast
 
         :param br_id: The ID (YouTube Video ID) of the broadcast to update
         :param stream_id: The ID of the stream to attach to the broadcast
-        :return: The updated LiveBroadcast resource
+        :return: The updated broadcast
         """
         if not stream_id:
             stream_id = config.youtube['stream_key_id']
         log.info(f'Binding stream "{stream_id}" to broadcast {br_id}')
-        result = self._live_broadcasts.bind(id=br_id, part=DEFAULT_PART, streamId=stream_id).execute()
-        return result
+        self._use_quota(WRITE_COST)
+        result = self._live_broadcasts.bind(id=br_id, part=BROADCAST_PART, fields=BROADCAST_FIELDS,
+                                            streamId=stream_id).execute()
+        return Broadcast.from_api_json(result)
 
-    def set_thumbnails(self, broadcast: LiveBroadcast, thumbnail_uri: str) -> LiveBroadcast:
+    def set_thumbnails(self, broadcast: Broadcast, thumbnail_uri: str) -> Broadcast:
         """
         Set the thumbnail of a broadcast
         :param broadcast: The broadcast to update
         :param thumbnail_uri: The URI to the thumbnail.
             If the scheme is 'file://' or unset, load the file at the specified path, otherwise treat as http URL
-        :return: The updated LiveBroadcast resource
+        :return: The broadcast (thumbnails are not part of the compact record)
         """
+        self._use_quota(WRITE_COST)
         parsed_uri = urllib.parse.urlparse(thumbnail_uri)
         if parsed_uri.scheme == '' and Path(thumbnail_uri).exists():
             file = open(thumbnail_uri, 'rb')
@@ -219,7 +408,7 @@ class YouTube:
             mime = mimetypes.guess_file_type(path)[0]
             message = 'from local file ' + Path(path).name
         else:
-            response: HTTPResponse = urllib.request.urlopen(thumbnail_uri)
+            response = cassette.urlopen(thumbnail_uri, config.timeouts['read'])
             file = tempfile.TemporaryFile()
             mime = response.headers.get_content_type()
             # noinspection PyTypeChecker
@@ -228,9 +417,8 @@ class YouTube:
 
         with file as fd:
             media_upload = MediaIoBaseUpload(fd, mime)
-            log.info('Updating thumbnail for broadcast "%s" %s', broadcast['id'], message)
-            result = self._service.thumbnails().set(videoId=broadcast['id'], media_body=media_upload).execute()
-        broadcast['snippet']['thumbnails'] = result['items'][0]
+            log.info('Updating thumbnail for broadcast "%s" %s', broadcast.id, message)
+            self._service.thumbnails().set(videoId=broadcast.id, media_body=media_upload, fields='kind').execute()
         return broadcast
 
     def delete_broadcast(self, br_id: str):
@@ -239,4 +427,5 @@ class YouTube:
         :param br_id: ID of the broadcast to delete
         """
         log.info(f'Deleting Broadcast {br_id}')
+        self._use_quota(WRITE_COST)
         self._live_broadcasts.delete(id=br_id).execute()
@@ -1,50 +1,147 @@
+import contextlib
+import functools
 import ipaddress
 import json
-import os.path
+import logging
+import os
 import socket
+import tempfile
+import threading
 import urllib.parse
+from datetime import datetime, timedelta, UTC
 from http import HTTPStatus
 from http.server import BaseHTTPRequestHandler, HTTPServer
-from typing import cast
+from typing import cast, Optional
 
+import google.auth.transport.requests
 import google_auth_oauthlib.flow
 from google.oauth2.credentials import Credentials
 from oauthlib.oauth2 import OAuth2Error
 
 import config
 
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of this process are synchronized
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
 SCOPES = ['https://www.googleapis.com/auth/youtube.force-ssl']
 
+_thread_lock = threading.RLock()
+"""Serializes access to credential files between threads of this process"""
+
+
+class PersistentCredentials(Credentials):
+    """
+    Credentials which are saved to :py:attr:`credentials_file` after every refresh.
 
-def save_credentials(credentials):
+    Before asking the token endpoint for a new access token, the file is checked for a token that another worker
+    (or an earlier run) has already refreshed.
+    """
+
+    credentials_file: str
+    """Path of the file the credentials were loaded from"""
+
+    def refresh(self, request):
+        with _locked(self.credentials_file):
+            stored = _read_credentials(self.credentials_file)
+            if stored and stored.token != self.token and stored.expiry and not _expires_within(stored, timedelta()):
+                self.token = stored.token
+                self.expiry = stored.expiry
+                log.info('Using YouTube access token refreshed by another worker.')
+                return
+
+            super().refresh(request)
+            _write_credentials(self, self.credentials_file)
+        log.info('Refreshed and saved YouTube access token.')
+
+    def refresh_ahead(self, margin: timedelta, timeout: float):
+        """
+        Refresh the access token if it expires within ``margin``, so it stays valid for the whole run
+
+        :param margin: How long the token needs to be valid at least
+        :param timeout: Timeout of the request to the token endpoint in seconds
+        """
+        if _expires_within(self, margin):
+            self.refresh(functools.partial(google.auth.transport.requests.Request(), timeout=timeout))
+
+
+def _expires_within(credentials: Credentials, margin: timedelta) -> bool:
+    """Whether the access token is unknown, or expires within ``margin`` from now (expiry is naive UTC)"""
+    if not credentials.token or credentials.expiry is None:
+        return True
+    return credentials.expiry - margin <= datetime.now(UTC).replace(tzinfo=None)
+
+
+@contextlib.contextmanager
+def _locked(cred_path: str):
+    """Hold an exclusive lock on the credentials file, shared by all threads and processes using it"""
+    with _thread_lock, open(cred_path + '.lock', 'a') as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _write_credentials(credentials: Credentials, cred_path: str):
+    """Atomically replace the credentials file, so concurrent readers never see a partial file"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(cred_path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as cred_file:
+            # noinspection PyTypeChecker
+            json.dump({'token': credentials.token,
+                       'expiry': credentials.expiry.isoformat() if credentials.expiry else None,
+                       'refresh_token': credentials.refresh_token,
+                       'token_uri': credentials.token_uri,
+                       'client_id': credentials.client_id,
+                       'client_secret': credentials.client_secret,
+                       'granted_scopes': credentials.granted_scopes},
+                      cred_file)
+        os.replace(tmp_path, cred_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _read_credentials(cred_path: str) -> Optional[PersistentCredentials]:
+    """Read the credentials file, if it exists"""
+    if not os.path.exists(cred_path):
+        return None
+    with open(cred_path, 'r') as cred_file:
+        values = json.load(cred_file)
+    # Expiry is naive UTC, as used by google-auth
+    expiry = values.pop('expiry', None)
+    credentials = PersistentCredentials(**values,
+                                        expiry=datetime.fromisoformat(expiry.rstrip('Z')) if expiry else None)
+    credentials.credentials_file = cred_path
+    return credentials
+
+
+def save_credentials(credentials: Credentials):
     """
     Save API credentials to the save file
 
     :param credentials: The credentials to save
     """
     cred_path = config.youtube['credentials_file']
-    with open(cred_path, 'w') as cred_file:
-        # noinspection PyTypeChecker
-        json.dump({'token': credentials.token,
-                   'refresh_token': credentials.refresh_token,
-                   'token_uri': credentials.token_uri,
-                   'client_id': credentials.client_id,
-                   'client_secret': credentials.client_secret,
-                   'granted_scopes': credentials.granted_scopes},
-                  cred_file)
-
-
-def load_credentials() -> Credentials | None:
+    with _locked(cred_path):
+        _write_credentials(credentials, cred_path)
+
+
+def load_credentials() -> Optional[PersistentCredentials]:
     """
     Load API credentials from the save file.
 
     :return: The loaded credentials, or None, if none were found.
     """
     cred_path = config.youtube['credentials_file']
-    if os.path.exists(cred_path):
-        with open(cred_path, 'r') as cred_file:
-            return Credentials(**json.load(cred_file))
-    return None
+    with _locked(cred_path):
+        return _read_credentials(cred_path)
 
 
 # helper variables for passing information between callback and main app flow
@@ -0,0 +1,100 @@
+"""
+Benchmark the memory used by events and their attached broadcasts
+
+Run with ``PYTHONPATH=ctla python tools/bench_event_memory.py [number of events]``
+"""
+import datetime
+import sys
+import tracemalloc
+
+from ct.EventFile import EventFile, EventFileType
+from ct.Facts import Facts, ManageStreamBehavior, YtVisibility
+from data import Event
+from yt.Broadcast import Broadcast
+
+
+def _live_broadcast(i: int) -> dict:
+    """Build a ``LiveBroadcast`` resource shaped like the ones returned by the API"""
+    thumbnail = {'url': f'https://i.ytimg.com/vi/video{i:06}/default_live.jpg', 'width': 120, 'height': 90}
+    return {
+        'kind': 'youtube#liveBroadcast',
+        'etag': f'etag-{i:020}',
+        'id': f'video{i:06}',
+        'snippet': {
+            'publishedAt': '2025-01-01T10:00:00Z',
+            'channelId': 'UCxxxxxxxxxxxxxxxxxxxxxx',
+            'title': f'Service {i} on 01.01.2025 - with Speaker',
+            'description': 'Livestream from our church\nSpeaker: Speaker',
+            'thumbnails': {size: dict(thumbnail) for size in ('default', 'medium', 'high', 'standard', 'maxres')},
+            'scheduledStartTime': '2025-01-01T10:00:00Z',
+            'scheduledEndTime': '2025-01-01T12:00:00Z',
+            'isDefaultBroadcast': False,
+            'liveChatId': f'chat-{i:040}'
+        },
+        'status': {
+            'lifeCycleStatus': 'ready',
+            'privacyStatus': 'unlisted',
+            'recordingStatus': 'notRecording',
+            'madeForKids': False,
+            'selfDeclaredMadeForKids': False
+        },
+        'contentDetails': {
+            'boundStreamId': 'stream-key-id',
+            'boundStreamLastUpdateTimeMs': '2025-01-01T09:00:00Z',
+            'monitorStream': {'enableMonitorStream': True, 'broadcastStreamDelayMs': 0,
+                              'embedHtml': '<iframe width="425" height="344" src="https://www.youtube.com/embed/x">'},
+            'enableEmbed': True,
+            'enableDvr': True,
+            'recordFromStart': True,
+            'enableClosedCaptions': False,
+            'closedCaptionsType': 'closedCaptionsDisabled',
+            'enableLowLatency': True,
+            'latencyPreference': 'low',
+            'projection': 'rectangular',
+            'enableAutoStart': False,
+            'enableAutoStop': False
+        }
+    }
+
+
+def _build_events(count: int) -> list[Event]:
+    start = datetime.datetime(2025, 1, 1, 10, tzinfo=datetime.UTC)
+    return [
+        Event(
+            id=i,
+            category_id=1,
+            appointment_id=i,
+            start_time=start + datetime.timedelta(days=i),
+            end_time=start + datetime.timedelta(days=i, hours=2),
+            title=f'Service {i}',
+            note='',
+            isCanceled=False,
+            speaker='Speaker',
+            facts=Facts(behavior=ManageStreamBehavior.YES, visibility=YtVisibility.UNLISTED, link_in_cal=False,
+                        on_homepage=True, create_post=False),
+            yt_link=EventFile(id=i, type=EventFileType.LINK, name='YouTube-Stream', url=f'https://youtu.be/video{i:06}')
+        )
+        for i in range(count)
+    ]
+
+
+def _measure(label: str, count: int, attach) -> None:
+    tracemalloc.start()
+    events = _build_events(count)
+    for i, event in enumerate(events):
+        event.yt_broadcast = attach(_live_broadcast(i))
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{label:28} {count} events: {current / 1024 / 1024:7.2f} MiB retained '
+          f'({current / count:6.0f} B/event), {peak / 1024 / 1024:7.2f} MiB peak')
+    del events
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    _measure('raw LiveBroadcast resources', count, lambda resource: resource)
+    _measure('compact Broadcast records', count, Broadcast.from_api_json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""
+Benchmark content insertion into large WordPress pages
+
+Run with ``PYTHONPATH=ctla python tools/bench_wordpress_page.py [size in MiB]``
+"""
+import sys
+import timeit
+
+import config
+from wp import WordPressPage
+
+config.wordpress = {'content_tag': 'ct-livestreams', 'wpbakery_compat': False}
+
+
+def _build_page(size: int, tag_count: int, bakery: bool) -> WordPressPage.WordPressPage:
+    """Build a page of roughly ``size`` bytes with ``tag_count`` content tags spread evenly across it"""
+    filler = '<div class="vc_row"><p>Lorem ipsum dolor sit amet, consectetur adipiscing elit.</p></div>\n'
+    chunk = filler * max(1, size // (tag_count + 1) // len(filler))
+    if bakery:
+        tag = '[vc_raw_html el_class="ct-livestreams"]PGRpdj5vbGQ8L2Rpdj4=[/vc_raw_html]'
+    else:
+        tag = '<!-- ct-livestreams --><div>old</div><!-- /ct-livestreams -->'
+    raw = ''.join(chunk + tag for _ in range(tag_count)) + chunk
+    return WordPressPage.WordPressPage(id=1, title={'raw': 'Benchmark'}, content={'raw': raw})
+
+
+def main():
+    size = int(float(sys.argv[1]) * 1024 * 1024) if len(sys.argv) > 1 else 4 * 1024 * 1024
+    content = '<a href="https://youtu.be/dQw4w9WgXcQ">Service on 01.01.2025</a>\n' * 20
+
+    for bakery in (False, True):
+        config.wordpress['wpbakery_compat'] = bakery
+        for tag_count in (1, 100, 10_000):
+            page = _build_page(size, tag_count, bakery)
+            runs, total = timeit.Timer(lambda: WordPressPage.insert_content(page, content)).autorange()
+            print(f'{"wpbakery" if bakery else "plain":8} {len(page["content"]["raw"]) / 1024 / 1024:6.1f} MiB '
+                  f'{tag_count:6} tags: {total / runs * 1000:8.2f} ms')
+
+
+if __name__ == '__main__':
+    main()